@@ -3,3 +3,4 @@ name = 'pycromanager'
 from pycromanager.acquire import Acquisition, multi_d_acquisition_events
 from pycromanager.core import Bridge, JavaObjectShadow
 from pycromanager.data import Dataset
+from pycromanager.writer import NDTiffWriter
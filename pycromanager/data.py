@@ -7,9 +7,149 @@ import numpy as np
 import sys
 import json
 import platform
+import zlib
 import dask.array as da
 import dask
 import warnings
+import threading
+import queue
+import uuid
+from bisect import bisect_right
+from collections import OrderedDict
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+
+class _LazyMetadata(Mapping):
+    """
+    Read-only mapping over the raw JSON metadata of an image that only decodes the values of the keys looked up. On
+    first access, an index of the depth of every object and array in the JSON is built from the positions of its
+    brackets and braces, which is enough to find top level keys with str.find and decode each value on its own.
+    Iterating over the keys, or a key that other JSON writers might escape, decodes everything
+    """
+    # more brackets and braces than this and the index isn't worth building, so everything is decoded instead
+    MAX_INDEX_SIZE = 1024
+    # smaller than this and json.loads is faster than building the index
+    MIN_LAZY_LENGTH = 2048
+    _DECODER = json.JSONDecoder()
+
+    def __init__(self, raw):
+        """
+        :param raw: bytes or str of a JSON object
+        """
+        self._text = raw if isinstance(raw, str) else bytes(raw).decode('utf-8')
+        # values decoded so far
+        self._values = {}
+        # the whole object, once decoded
+        self._decoded = None
+        # (text with escaped backslashes blanked out, whether it has escaped quotes, positions of brackets and braces
+        # outside of strings, depth after each of them), built on first access
+        self._index = None
+
+    def _build_index(self):
+        """
+        :return: the index, or None if there are too many brackets and braces to be worth it
+        """
+        # blank out escaped backslashes, keeping the length, so that a quote after a backslash is always escaped
+        text = self._text.replace('\\\\', '__') if '\\\\' in self._text else self._text
+        positions = []
+        for char in '{}[]':
+            position = text.find(char)
+            while position != -1:
+                positions.append(position)
+                position = text.find(char, position + 1)
+            if len(positions) > self.MAX_INDEX_SIZE:
+                return None
+        positions.sort()
+        has_escaped_quotes = '\\"' in text
+        structure_positions, depths = [], []
+        quotes, previous, depth = 0, 0, 0
+        for position in positions:
+            # an odd number of quotes before a bracket means it's inside a string
+            quotes += text.count('"', previous, position)
+            if has_escaped_quotes:
+                quotes -= text.count('\\"', previous, position)
+            previous = position
+            if not quotes % 2:
+                depth += 1 if text[position] in '{[' else -1
+                structure_positions.append(position)
+                depths.append(depth)
+        return text, has_escaped_quotes, structure_positions, depths
+
+    def _find_value(self, key):
+        """
+        :return: position in the text of the value of a top level key, or None if there isn't one
+        """
+        text, has_escaped_quotes, structure_positions, depths = self._index
+        quoted_key = '"' + key + '"'
+        # the text between two consecutive strings always has a comma or colon in it, so only keys with one could match
+        # the end of one string and the start of the next
+        check_outside_string = ',' in key or ':' in key
+        value_start = None
+        position = text.find(quoted_key)
+        while position != -1:
+            colon = position + len(quoted_key)
+            while colon < len(text) and text[colon] in ' \t\r\n':
+                colon += 1
+            # the last occurrence wins, as with json.loads
+            if colon < len(text) and text[colon] == ':' and text[position - 1] != '\\':
+                structure_index = bisect_right(structure_positions, position) - 1
+                is_top_level = structure_index >= 0 and depths[structure_index] == 1
+                if is_top_level and check_outside_string:
+                    is_top_level = self._is_outside_string(text, has_escaped_quotes,
+                                                           structure_positions[structure_index], position)
+                if is_top_level:
+                    value_start = colon + 1
+                    while text[value_start] in ' \t\r\n':
+                        value_start += 1
+            position = text.find(quoted_key, position + 1)
+        return value_start
+
+    @staticmethod
+    def _is_outside_string(text, has_escaped_quotes, start, position):
+        """
+        Check that a match for a quoted key starts with an opening quote, rather than being the end of one string and
+        the start of the next, by counting the quotes after the last bracket or brace (which is outside of any string)
+        """
+        quotes = text.count('"', start, position)
+        if has_escaped_quotes:
+            quotes -= text.count('\\"', start, position)
+        return not quotes % 2
+
+    def _decode_all(self):
+        if self._decoded is None:
+            self._decoded = json.loads(self._text)
+        return self._decoded
+
+    def __getitem__(self, key):
+        if self._decoded is not None:
+            return self._decoded[key]
+        if key in self._values:
+            return self._values[key]
+        # small metadata, and keys that can be written in more than one way (such as those with characters some writers
+        # escape), are decoded in full
+        if len(self._text) < self.MIN_LAZY_LENGTH or not isinstance(key, str) or not key.isascii() or \
+                not key.isprintable() or any(char in key for char in '"\\<>&=\''):
+            return self._decode_all()[key]
+        if self._index is None:
+            self._index = self._build_index()
+            if self._index is None:
+                return self._decode_all()[key]
+        value_start = self._find_value(key)
+        if value_start is None:
+            raise KeyError(key)
+        value = self._DECODER.raw_decode(self._text, value_start)[0]
+        self._values[key] = value
+        return value
+
+    def __iter__(self):
+        return iter(self._decode_all())
+
+    def __len__(self):
+        return len(self._decode_all())
+
+    def __repr__(self):
+        return '{}({!r})'.format(type(self).__name__, self._decode_all())
 
 
 class _MultipageTiffReader:
@@ -29,37 +169,168 @@ class _MultipageTiffReader:
     X_RESOLUTION = 282
     Y_RESOLUTION = 283
     RESOLUTION_UNIT = 296
+    PREDICTOR = 317
     MM_METADATA = 51123
 
+    # values of the compression tag
+    NO_COMPRESSION = 1
+    LZW_COMPRESSION = 5
+    DEFLATE_COMPRESSION = 8
+    OLD_DEFLATE_COMPRESSION = 32946
+    ZSTD_COMPRESSION = 50000
+
     # file format constants
     INDEX_MAP_OFFSET_HEADER = 54773648
     INDEX_MAP_HEADER = 3453623
     SUMMARY_MD_HEADER = 2355492
+    TIFF_MAGIC = 42
+    # BigTIFF-style variant of the format with 64 bit offsets, so that a single file can be larger than 4 GB. Compared
+    # to the standard layout, the first IFD offset, the index map offset and the IFD offset of each index map entry are
+    # 8 bytes, the summary metadata header starts at byte 40 rather than 32, and IFDs are laid out as in BigTIFF: an 8
+    # byte entry count, 20 byte entries with 8 byte counts and values, and an 8 byte next IFD offset
+    BIG_TIFF_MAGIC = 43
+
+    # one entry of the index map: the storage channel, z, time and position indices of an image along with the byte
+    # offsets of its IFD and its pixels
+    INDEX_MAP_DTYPE = np.dtype([('channel_index', np.int32), ('z_index', np.int32), ('t_index', np.int32),
+                                ('pos_index', np.int32), ('ifd_offset', np.uint64), ('pixel_offset', np.uint64)])
+    _AXES_FIELDS = ['channel_index', 'z_index', 't_index', 'pos_index']
+    # one 12 byte IFD entry. A value of type SHORT with a count of 1 only occupies the first two bytes of the value
+    # field, so it is also available on its own as short_value
+    IFD_ENTRY_DTYPE = np.dtype({'names': ['tag', 'type', 'count', 'value', 'short_value'],
+                                'formats': [np.uint16, np.uint16, np.uint32, np.uint32, np.uint16],
+                                'offsets': [0, 2, 4, 8, 8], 'itemsize': 12})
+    BIG_IFD_ENTRY_DTYPE = np.dtype({'names': ['tag', 'type', 'count', 'value', 'short_value'],
+                                    'formats': [np.uint16, np.uint16, np.uint64, np.uint64, np.uint16],
+                                    'offsets': [0, 2, 4, 12, 12], 'itemsize': 20})
+    # index map entries as stored in the file
+    RAW_INDEX_MAP_DTYPE = np.dtype([('channel_index', np.int32), ('z_index', np.int32), ('t_index', np.int32),
+                                    ('pos_index', np.int32), ('ifd_offset', np.uint32)])
+    BIG_RAW_INDEX_MAP_DTYPE = np.dtype([('channel_index', np.int32), ('z_index', np.int32), ('t_index', np.int32),
+                                        ('pos_index', np.int32), ('ifd_offset', np.uint64)])
+    # every IFD written by Micro-Manager has 13 entries, so pixels start at the same offset after each IFD
+    ENTRIES_PER_IFD = 13
 
-    def __init__(self, tiff_path):
+    def __init__(self, tiff_path, cached_header=None, handle_pool=None):
+        """
+        :param tiff_path: full path of the TIFF file
+        :param cached_header: optional (summary metadata, index map, first IFD offset, BigTIFF flag) tuple from a
+            previous call to _read_header on the same file, in which case the header isn't parsed again
+        :param handle_pool: optional _HandlePool that opens the file and its memory map on first access and may close
+            them again to stay within its limit. Without one, they're opened now and stay open until close()
+        """
         self.tiff_path = tiff_path
-        self.file = open(tiff_path, 'rb')
-        if platform.system() == 'Windows':
-            self.mmap_file = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
-        else:
-            self.mmap_file = mmap.mmap(self.file.fileno(), 0, prot=mmap.PROT_READ)
-        self.summary_md, self.index_tree, self.first_ifd_offset = self._read_header()
-        self.mmap_file.close()
-        self.np_memmap = np.memmap(self.file, dtype=np.uint8, mode='r')
+        self.file = None
+        self._np_memmap = None
+        self._handle_pool = handle_pool
+        if cached_header is None:
+            with open(tiff_path, 'rb') as file:
+                if platform.system() == 'Windows':
+                    self.mmap_file = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+                else:
+                    self.mmap_file = mmap.mmap(file.fileno(), 0, prot=mmap.PROT_READ)
+                cached_header = self._read_header()
+                self.mmap_file.close()
+        self.summary_md, index_map, self.first_ifd_offset, self.big_tiff = cached_header
+        self._layout = self.layout(self.big_tiff)
+        # number of index map entries read from the file so far, for picking up new ones on refresh
+        self._num_index_map_entries = index_map.size
+        # dict mapping (channel_index, z_index, t_index, pos_index) to (IFD byte offset, pixel byte offset, row of
+        # the index map)
+        self.index, self.index_map = self._build_index(index_map)
+        if handle_pool is None:
+            self._open()
+        # boolean array of which images in the index map have intact IFDs, computed on first use
+        self._valid_images = None
+        # compression tag value of the images in the file, read from the first IFD on first use
+        self._compression = None
 
         # get important metadata fields
         self.width = self.summary_md['Width']
         self.height = self.summary_md['Height']
         self.dtype = np.uint8 if self.summary_md['PixelType'] == 'GRAY8' else np.uint16
 
+    @property
+    def np_memmap(self):
+        """
+        Memory map of the whole file, opened first if necessary
+        """
+        if self._handle_pool is not None:
+            return self._handle_pool.touch(self)
+        if self._np_memmap is None:
+            self._open()
+        return self._np_memmap
+
+    def _open(self):
+        """
+        Open the file and memory map it, or map it again to include anything written since it was last mapped
+        """
+        if self.file is None:
+            self.file = open(self.tiff_path, 'rb')
+        self._np_memmap = np.memmap(self.file, dtype=np.uint8, mode='r')
+
+    def __getstate__(self):
+        # pickle as the path and parsed index only, so that readers can be sent to other processes cheaply. The file is
+        # reopened there on first access
+        state = self.__dict__.copy()
+        state['file'] = None
+        state['_np_memmap'] = None
+        state.pop('mmap_file', None)
+        return state
+
+    def _close_handles(self):
+        """
+        Close the file and release the memory map. Arrays already read from the memory map remain valid
+        """
+        self._np_memmap = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def advise_willneed(self, start, end):
+        """
+        Hint to the operating system that a range of bytes will be read soon, so that it starts reading them in the
+        background. Does nothing on platforms without madvise
+        """
+        memmap = self.np_memmap
+        mmap_obj = getattr(memmap, '_mmap', None)
+        if mmap_obj is None or not hasattr(mmap_obj, 'madvise') or not hasattr(mmap, 'MADV_WILLNEED'):
+            return
+        start = start // mmap.PAGESIZE * mmap.PAGESIZE
+        end = min(end, memmap.size)
+        if end > start:
+            mmap_obj.madvise(mmap.MADV_WILLNEED, start, end - start)
+
     def close(self):
-        self.file.close()
+        if self._handle_pool is not None:
+            self._handle_pool.discard(self)
+        self._close_handles()
+
+    @classmethod
+    def layout(cls, big_tiff):
+        """
+        :param big_tiff: True for the BigTIFF-style variant of the format with 64 bit offsets
+        :return: dict of the sizes, byte offsets and dtypes of the parts of the file that differ between the standard
+            and BigTIFF-style layouts
+        """
+        if big_tiff:
+            layout = {'offset_dtype': np.dtype(np.uint64), 'summary_md_header_offset': 40,
+                      'index_map_entry_dtype': cls.BIG_RAW_INDEX_MAP_DTYPE, 'ifd_count_dtype': np.dtype(np.uint64),
+                      'ifd_entry_dtype': cls.BIG_IFD_ENTRY_DTYPE}
+        else:
+            layout = {'offset_dtype': np.dtype(np.uint32), 'summary_md_header_offset': 32,
+                      'index_map_entry_dtype': cls.RAW_INDEX_MAP_DTYPE, 'ifd_count_dtype': np.dtype(np.uint16),
+                      'ifd_entry_dtype': cls.IFD_ENTRY_DTYPE}
+        layout['ifd_size'] = layout['ifd_count_dtype'].itemsize + cls.ENTRIES_PER_IFD * \
+            layout['ifd_entry_dtype'].itemsize + layout['offset_dtype'].itemsize
+        return layout
 
     def _read_header(self):
         """
         :param file:
-        :return: dictionary with summary metadata, nested dictionary of byte offsets of TIFF Image File Directories with
-        keys [channel_index][z_index][frame_index][position_index], int byte offset of first image IFD
+        :return: dictionary with summary metadata, structured array (INDEX_MAP_DTYPE) of the channel, z, time and
+        position indices of each image and the byte offsets of its TIFF Image File Directory and pixels, int byte offset
+        of first image IFD, and whether the file uses the BigTIFF-style layout
         """
         # read standard tiff header
         if self.mmap_file[:2] == b'\x4d\x4d':
@@ -72,53 +343,111 @@ class _MultipageTiffReader:
                 raise Exception("Potential issue with mismatched endian-ness")
         else:
             raise Exception('Endian type not specified correctly')
-        if np.frombuffer(self.mmap_file[2:4], dtype=np.uint16)[0] != 42:
+        magic = np.frombuffer(self.mmap_file[2:4], dtype=np.uint16)[0]
+        if magic not in (self.TIFF_MAGIC, self.BIG_TIFF_MAGIC):
             raise Exception('Tiff magic 42 missing')
-        first_ifd_offset = np.frombuffer(self.mmap_file[4:8], dtype=np.uint32)[0]
+        big_tiff = bool(magic == self.BIG_TIFF_MAGIC)
+        if big_tiff and np.frombuffer(self.mmap_file[4:6], dtype=np.uint16)[0] != 8:
+            raise Exception('Unsupported BigTIFF offset size')
+        layout = self.layout(big_tiff)
+        offset_dtype = layout['offset_dtype']
+        header_end = 4 + (4 if big_tiff else 0) + offset_dtype.itemsize
+        first_ifd_offset = int(np.frombuffer(self.mmap_file[header_end - offset_dtype.itemsize:header_end],
+                                             dtype=offset_dtype)[0])
 
         # read custom stuff: summary md, index map
-        index_map_offset_header, index_map_offset = np.frombuffer(self.mmap_file[8:16], dtype=np.uint32)
+        index_map_offset_header = np.frombuffer(self.mmap_file[header_end:header_end + 4], dtype=np.uint32)[0]
         if index_map_offset_header != self.INDEX_MAP_OFFSET_HEADER:
             raise Exception('Index map offset header wrong')
-        summary_md_header, summary_md_length = np.frombuffer(self.mmap_file[32:40], dtype=np.uint32)
+        summary_md_start = layout['summary_md_header_offset']
+        summary_md_header, summary_md_length = np.frombuffer(self.mmap_file[summary_md_start:summary_md_start + 8],
+                                                             dtype=np.uint32)
         if summary_md_header != self.SUMMARY_MD_HEADER:
             raise Exception('Index map offset header wrong')
-        summary_md = json.loads(self.mmap_file[40:40 + summary_md_length])
-        index_map_header, index_map_length = np.frombuffer(
-            self.mmap_file[40 + summary_md_length:48 + summary_md_length],
-            dtype=np.uint32)
+        summary_md = json.loads(self.mmap_file[summary_md_start + 8:summary_md_start + 8 + summary_md_length])
+        index_map_start = summary_md_start + 8 + summary_md_length
+        index_map_header, index_map_length = np.frombuffer(self.mmap_file[index_map_start:index_map_start + 8],
+                                                           dtype=np.uint32)
         if index_map_header != self.INDEX_MAP_HEADER:
             raise Exception('Index map header incorrect')
-        # get index map as nested list of ints
-        index_map_raw = np.reshape(np.frombuffer(self.mmap_file[48 + summary_md_length:48 +
-                                    summary_md_length + index_map_length * 20], dtype=np.int32), [-1, 5])
-        index_map_keys = index_map_raw[:, :4].view(np.int32)
-        index_map_byte_offsets = index_map_raw[:, 4].view(np.uint32)
+        entry_size = layout['index_map_entry_dtype'].itemsize
+        index_map_raw = self.mmap_file[index_map_start + 8:index_map_start + 8 + index_map_length * entry_size]
+        return summary_md, self._parse_index_map(index_map_raw, big_tiff), first_ifd_offset, big_tiff
+
+    @classmethod
+    def _parse_index_map(cls, index_map_raw, big_tiff=False):
+        """
+        :param index_map_raw: bytes of index map entries as stored in the file
+        :param big_tiff: the file uses the BigTIFF-style layout
+        :return: structured array with dtype INDEX_MAP_DTYPE
+        """
+        layout = cls.layout(big_tiff)
+        entries = np.frombuffer(index_map_raw, dtype=layout['index_map_entry_dtype'])
+        index_map = np.empty(entries.size, dtype=cls.INDEX_MAP_DTYPE)
+        for field in cls._AXES_FIELDS + ['ifd_offset']:
+            index_map[field] = entries[field]
         #for super fast reading of pixels: skip IFDs alltogether
-        entries_per_ifd = 13
-        num_entries = np.ones(index_map_byte_offsets.shape) * entries_per_ifd
-        # num_entries[0] += 4 #first one has 4 extra IFDs----Not anymore
-        index_map_pixel_byte_offsets = 2 + num_entries * 12 + 4 + index_map_byte_offsets
-        # unpack into a tree (i.e. nested dicts)
-        index_tree = {}
-        c_indices, z_indices, t_indices, p_indices = [np.unique(index_map_keys[:, i]) for i in range(4)]
-        for c_index in c_indices:
-            for z_index in z_indices:
-                for t_index in t_indices:
-                    for p_index in p_indices:
-                        entry_index = np.flatnonzero((index_map_keys == np.array([c_index, z_index, t_index, p_index])).all(-1))
-                        if entry_index.size != 0:
-                            # fill out tree as needed
-                            if c_index not in index_tree.keys():
-                                index_tree[c_index] = {}
-                            if z_index not in index_tree[c_index].keys():
-                                index_tree[c_index][z_index] = {}
-                            if t_index not in index_tree[c_index][z_index].keys():
-                                index_tree[c_index][z_index][t_index] = {}
-                            index_tree[c_index][z_index][t_index][p_index] = \
-                                            (int(index_map_byte_offsets[entry_index[-1]]),
-                                             int(index_map_pixel_byte_offsets[entry_index[-1]]))
-        return summary_md, index_tree, first_ifd_offset
+        index_map['pixel_offset'] = index_map['ifd_offset'] + layout['ifd_size']
+        return index_map
+
+    def refresh(self):
+        """
+        Pick up images added to the file since it was opened or last refreshed, for files that are still being written.
+        Relies on the writer updating the image count of the index map after the image itself has been written
+
+        :return: list of (channel_index, z_index, t_index, pos_index) tuples of the new images
+        """
+        # read the image count before remapping, so every image it counts lies within the part of the file that gets
+        # mapped. The existing memory map is shared with the writer, so it shows the current count
+        summary_md_start = self._layout['summary_md_header_offset']
+        summary_md_length = int(self.np_memmap[summary_md_start + 4:summary_md_start + 8].view(np.uint32)[0])
+        index_map_start = summary_md_start + 8 + summary_md_length
+        index_map_length = int(self.np_memmap[index_map_start + 4:index_map_start + 8].view(np.uint32)[0])
+        if index_map_length <= self._num_index_map_entries:
+            return []
+        if self._handle_pool is not None:
+            self._handle_pool.touch(self, remap=True)
+        else:
+            self._open()
+        entry_size = self._layout['index_map_entry_dtype'].itemsize
+        new_entries = self._parse_index_map(self._read(index_map_start + 8 + self._num_index_map_entries * entry_size,
+                                                       index_map_start + 8 + index_map_length * entry_size),
+                                            self.big_tiff)
+        self._num_index_map_entries = index_map_length
+
+        new_keys = list(zip(*[new_entries[field].tolist() for field in self._AXES_FIELDS]))
+        first_row = self.index_map.size
+        self.index_map = np.concatenate([self.index_map, new_entries])
+        if len(set(new_keys)) != len(new_keys) or any(key in self.index for key in new_keys):
+            # an image was written again, so rebuild the index to drop its old entry
+            self.index, self.index_map = self._build_index(self.index_map)
+            self._valid_images = None
+        else:
+            self.index.update(zip(new_keys, zip(new_entries['ifd_offset'].tolist(),
+                                                new_entries['pixel_offset'].tolist(),
+                                                range(first_row, self.index_map.size))))
+            if self._valid_images is not None:
+                self._valid_images = np.concatenate([self._valid_images, self._check_ifds(new_entries)])
+        return new_keys
+
+    @classmethod
+    def _build_index(cls, index_map):
+        """
+        Build a dict mapping (channel_index, z_index, t_index, pos_index) tuples to (IFD byte offset, pixel byte offset,
+        row of the index map) in a single pass over the index map. If an image appears more than once, the last entry wins
+
+        :param index_map: structured array with dtype INDEX_MAP_DTYPE
+        :return: the dict, and the index map with any superseded entries removed
+        """
+        keys = list(zip(*[index_map[field].tolist() for field in cls._AXES_FIELDS]))
+        rows = dict(zip(keys, range(index_map.size)))
+        if len(rows) != index_map.size:
+            kept_rows = sorted(rows.values())
+            index_map = index_map[kept_rows]
+            keys = [keys[row] for row in kept_rows]
+        index = dict(zip(keys, zip(index_map['ifd_offset'].tolist(), index_map['pixel_offset'].tolist(),
+                                   range(index_map.size))))
+        return index, index_map
 
     def _read(self, start, end):
         """
@@ -129,36 +458,107 @@ class _MultipageTiffReader:
     def _read_ifd(self, byte_offset):
         """
         Read image file directory. First two bytes are number of entries (n), next n*12 bytes are individual IFDs, final 4
-        bytes are next IFD offset location
+        bytes are next IFD offset location (8, n*20 and 8 bytes in BigTIFF-style files). The whole directory is read at
+        once and decoded with IFD_ENTRY_DTYPE
         :return: dictionary with fields needed for reading
         """
-        num_entries = np.frombuffer(self._read(byte_offset, byte_offset + 2), dtype=np.uint16)[0]
-        info = {}
-        for i in range(num_entries):
-            tag, type = np.frombuffer(self._read(byte_offset + 2 + i * 12, byte_offset + 2 + i * 12 + 4),
-                                      dtype=np.uint16)
-            count = \
-            np.frombuffer(self._read(byte_offset + 2 + i * 12 + 4, byte_offset + 2 + i * 12 + 8), dtype=np.uint32)[0]
-            if type == 3 and count == 1:
-                value = \
-                np.frombuffer(self._read(byte_offset + 2 + i * 12 + 8, byte_offset + 2 + i * 12 + 10), dtype=np.uint16)[
-                    0]
-            else:
-                value = \
-                np.frombuffer(self._read(byte_offset + 2 + i * 12 + 8, byte_offset + 2 + i * 12 + 12), dtype=np.uint32)[
-                    0]
-            # save important tags for reading images
-            if tag == self.MM_METADATA:
-                info['md_offset'] = value
-                info['md_length'] = count
-            elif tag == self.STRIP_OFFSETS:
-                info['pixel_offset'] = value
-            elif tag == self.STRIP_BYTE_COUNTS:
-                info['bytes_per_image'] = value
-        info['next_ifd_offset'] = np.frombuffer(self._read(byte_offset + num_entries * 12 + 2,
-                                                           byte_offset + num_entries * 12 + 6), dtype=np.uint32)[0]
-        if 'bytes_per_image' not in info or 'pixel_offset' not in info:
+        byte_offset = int(byte_offset)
+        count_dtype, entry_dtype = self._layout['ifd_count_dtype'], self._layout['ifd_entry_dtype']
+        offset_dtype = self._layout['offset_dtype']
+        entries_start = byte_offset + count_dtype.itemsize
+        num_entries = int(np.frombuffer(self._read(byte_offset, entries_start), dtype=count_dtype)[0])
+        entries_size = num_entries * entry_dtype.itemsize
+        ifd = self._read(entries_start, entries_start + entries_size + offset_dtype.itemsize)
+        if len(ifd) != entries_size + offset_dtype.itemsize:
+            raise Exception('IFD extends past end of file, file may be corrupted')
+        entries = np.frombuffer(ifd, dtype=entry_dtype, count=num_entries)
+        values = np.where((entries['type'] == 3) & (entries['count'] == 1), entries['short_value'], entries['value'])
+        # save important tags for reading images
+        is_tag = entries['tag'][:, None] == np.array([self.MM_METADATA, self.STRIP_OFFSETS, self.STRIP_BYTE_COUNTS])
+        if not np.all(np.any(is_tag[:, 1:], axis=0)):
             raise Exception('Missing tags in IFD entry, file may be corrupted')
+        entry_index = np.argmax(is_tag, axis=0).tolist()
+        info = {'pixel_offset': int(values[entry_index[1]]), 'bytes_per_image': int(values[entry_index[2]])}
+        if np.any(is_tag[:, 0]):
+            info['md_offset'] = int(values[entry_index[0]])
+            info['md_length'] = int(entries['count'][entry_index[0]])
+        info['next_ifd_offset'] = int(np.frombuffer(ifd, dtype=offset_dtype, offset=entries_size)[0])
+        for tag, field in [(self.COMPRESSION, 'compression'), (self.PREDICTOR, 'predictor')]:
+            is_field_tag = entries['tag'] == tag
+            info[field] = int(values[np.argmax(is_field_tag)]) if np.any(is_field_tag) else 1
+        # images split into several strips have arrays of strip offsets and byte counts
+        strip_offsets, strip_byte_counts = entries[entry_index[1]], entries[entry_index[2]]
+        if strip_offsets['count'] > 1:
+            info['strip_offsets'] = self._read_tag_array(strip_offsets)
+            info['strip_byte_counts'] = self._read_tag_array(strip_byte_counts)
+        else:
+            info['strip_offsets'] = [info['pixel_offset']]
+            info['strip_byte_counts'] = [info['bytes_per_image']]
+        return info
+
+    def _read_tag_array(self, entry):
+        """
+        Read the array of SHORT, LONG or LONG8 values of an IFD entry whose values don't fit in the entry itself
+        """
+        dtype = {3: np.uint16, 16: np.uint64}.get(int(entry['type']), np.uint32)
+        start = int(entry['value'])
+        return np.frombuffer(self._read(start, start + int(entry['count']) * np.dtype(dtype).itemsize),
+                             dtype=dtype).astype(np.int64).tolist()
+
+    def _read_ifds(self, byte_offsets, chunk_size=4096):
+        """
+        Batch version of _read_ifd that decodes the IFDs at many byte offsets in one vectorized pass. Corrupted IFDs are
+        flagged rather than raising an exception
+
+        :param byte_offsets: array of IFD byte offsets
+        :param chunk_size: number of IFDs decoded per vectorized operation, to bound memory use
+        :return: dictionary of arrays with one entry per IFD for the same fields as _read_ifd, plus a boolean array
+            'valid' that is False where the IFD lies outside the file, has no entries or far more than Micro-Manager
+            writes, or is missing the tags needed for reading. Fields of IFDs without metadata tags have a md_length of 0
+        """
+        byte_offsets = np.asarray(byte_offsets, dtype=np.int64)
+        fields = ['md_offset', 'md_length', 'pixel_offset', 'bytes_per_image', 'next_ifd_offset']
+        info = {field: np.zeros(byte_offsets.shape, dtype=np.int64) for field in fields}
+        info['valid'] = np.zeros(byte_offsets.shape, dtype=bool)
+        file_size = self.np_memmap.size
+        count_dtype, entry_dtype = self._layout['ifd_count_dtype'], self._layout['ifd_entry_dtype']
+        offset_dtype = self._layout['offset_dtype']
+        count_size, entry_size = count_dtype.itemsize, entry_dtype.itemsize
+        for start in range(0, byte_offsets.size, chunk_size):
+            chunk = slice(start, start + chunk_size)
+            offsets = byte_offsets[chunk]
+            in_file = offsets + count_size <= file_size
+            num_entries = np.zeros(offsets.shape, dtype=np.int64)
+            num_entries[in_file] = self._gather(offsets[in_file], count_size).view(count_dtype)[:, 0]
+            in_file &= offsets + count_size + num_entries * entry_size + offset_dtype.itemsize <= file_size
+            # entries are gathered up to the largest count in the chunk, so a torn IFD with a huge count mustn't be
+            # allowed to inflate the gather for every other IFD
+            in_file &= (num_entries > 0) & (num_entries <= 2 * self.ENTRIES_PER_IFD)
+            if not np.any(in_file):
+                continue
+            offsets = offsets[in_file]
+            num_entries = num_entries[in_file]
+            max_entries = np.max(num_entries)
+            entries = self._gather(offsets + count_size, max_entries * entry_size).view(entry_dtype)
+            entry_exists = np.arange(max_entries) < num_entries[:, None]
+            values = np.where((entries['type'] == 3) & (entries['count'] == 1), entries['short_value'],
+                              entries['value']).astype(np.int64)
+            rows = np.arange(entries.shape[0])
+            chunk_info = {'next_ifd_offset': self._gather(offsets + count_size + num_entries * entry_size,
+                                                          offset_dtype.itemsize).view(offset_dtype)[:, 0]}
+            has_tag = {}
+            for tag, field, count_field in [(self.MM_METADATA, 'md_offset', 'md_length'),
+                                            (self.STRIP_OFFSETS, 'pixel_offset', None),
+                                            (self.STRIP_BYTE_COUNTS, 'bytes_per_image', None)]:
+                is_tag = entry_exists & (entries['tag'] == tag)
+                entry_index = np.argmax(is_tag, axis=1)
+                has_tag[tag] = np.any(is_tag, axis=1)
+                chunk_info[field] = np.where(has_tag[tag], values[rows, entry_index], 0)
+                if count_field is not None:
+                    chunk_info[count_field] = np.where(has_tag[tag], entries['count'][rows, entry_index], 0)
+            chunk_info['valid'] = has_tag[self.STRIP_OFFSETS] & has_tag[self.STRIP_BYTE_COUNTS]
+            for field, values in chunk_info.items():
+                info[field][chunk][in_file] = values
         return info
 
     # def _read_pixels(self, offset, length, memmapped):
@@ -176,14 +576,123 @@ class _MultipageTiffReader:
     #         pixels = np.frombuffer(self._read(offset, offset + length), dtype=pixel_type)
     #         return np.reshape(pixels, [self.height, self.width])
 
-    def read_metadata(self, channel_index, z_index, t_index, pos_index):
-        ifd_offset, pixels_offset = self.index_tree[channel_index][z_index][t_index][pos_index]
+    def read_metadata(self, channel_index, z_index, t_index, pos_index, lazy=False):
+        """
+        :param lazy: return a _LazyMetadata that only decodes the keys looked up, rather than a dict
+        """
+        ifd_offset, pixels_offset, _ = self.index[channel_index, z_index, t_index, pos_index]
         ifd_data = self._read_ifd(ifd_offset)
-        metadata = json.loads(self._read(ifd_data['md_offset'], ifd_data['md_offset'] + ifd_data['md_length']))
-        return metadata
+        raw = self._read(ifd_data['md_offset'], ifd_data['md_offset'] + ifd_data['md_length'])
+        return _LazyMetadata(raw) if lazy else json.loads(raw)
+
+    def read_metadata_batch(self, indices, lazy=False):
+        """
+        Read the metadata of many images, decoding all of their IFDs in one vectorized pass
+
+        :param indices: list of (channel_index, z_index, t_index, pos_index) tuples
+        :param lazy: return _LazyMetadata that only decode the keys looked up, rather than dicts
+        :return: list of metadata dicts in the same order
+        """
+        ifd_data = self._read_ifds([self.index[image_index][0] for image_index in indices])
+        if not np.all(ifd_data['valid']):
+            raise Exception('Missing tags in IFD entry, file may be corrupted')
+        decode = _LazyMetadata if lazy else json.loads
+        return [decode(self._read(offset, offset + length)) for offset, length in
+                zip(ifd_data['md_offset'].tolist(), ifd_data['md_length'].tolist())]
 
-    def read_image(self, channel_index, z_index, t_index, pos_index, read_metadata=False, memmapped=False):
-        ifd_offset, pixels_offset = self.index_tree[channel_index][z_index][t_index][pos_index]
+    def read_metadata_fields(self, keys):
+        """
+        Read selected top level metadata fields of every image in the file, in on-disk order
+
+        :param keys: list of metadata keys
+        :return: index map entries of the images in the order they were read, and a dict mapping each key to a list of
+            values, which are None for images whose metadata doesn't contain the key or is corrupted
+        """
+        index_map = self.index_map[np.argsort(self.index_map['ifd_offset'], kind='stable')]
+        ifd_data = self._read_ifds(index_map['ifd_offset'])
+        # metadata cut off by the end of the file (e.g. by a crashed acquisition) is read as missing
+        readable = ifd_data['valid'] & (ifd_data['md_length'] > 0) & \
+            (ifd_data['md_offset'] + ifd_data['md_length'] <= self.np_memmap.size)
+        columns = {key: [] for key in keys}
+        for offset, length, is_readable in zip(ifd_data['md_offset'].tolist(), ifd_data['md_length'].tolist(),
+                                               readable.tolist()):
+            # only the requested keys are decoded
+            metadata = _LazyMetadata(self._read(offset, offset + length)) if is_readable else {}
+            for key in keys:
+                columns[key].append(metadata.get(key))
+        return index_map, columns
+
+    @property
+    def compression(self):
+        """
+        Compression tag value of the images in the file, e.g. NO_COMPRESSION
+        """
+        if self._compression is None:
+            compression = self.NO_COMPRESSION
+            if self.index_map.size:
+                try:
+                    compression = self._read_ifd(self.index_map['ifd_offset'][0])['compression']
+                except Exception:
+                    # one corrupted IFD mustn't make every other image in the file unreadable, so read the tag from
+                    # the first image that is intact instead
+                    valid_rows = np.flatnonzero(self.valid_images())
+                    if valid_rows.size:
+                        compression = self._read_ifd(self.index_map['ifd_offset'][valid_rows[0]])['compression']
+            self._compression = compression
+        return self._compression
+
+    @classmethod
+    def _decompressor(cls, compression):
+        """
+        :return: function that decompresses the bytes of one strip compressed with the given compression tag value
+        """
+        if compression in (cls.DEFLATE_COMPRESSION, cls.OLD_DEFLATE_COMPRESSION):
+            return zlib.decompress
+        if compression == cls.ZSTD_COMPRESSION:
+            try:
+                import zstandard
+            except ImportError:
+                raise Exception('Reading zstd compressed images requires the zstandard package')
+            # decompressobj doesn't need the decompressed size to be stored in the compressed data
+            return lambda data: zstandard.ZstdDecompressor().decompressobj().decompress(data)
+        if compression == cls.LZW_COMPRESSION:
+            try:
+                import imagecodecs
+            except ImportError:
+                raise Exception('Reading LZW compressed images requires the imagecodecs package')
+            return imagecodecs.lzw_decode
+        raise Exception('Unsupported TIFF compression: {}'.format(compression))
+
+    def _read_compressed_image(self, ifd_offset):
+        """
+        Read and decompress the strips of an image, which is done outside of the global interpreter lock so that many
+        images can be decompressed in parallel by a pool of threads
+        """
+        ifd_data = self._read_ifd(ifd_offset)
+        decompress = self._decompressor(ifd_data['compression'])
+        pixels = b''.join(decompress(self._read(offset, offset + byte_count)) for offset, byte_count in
+                          zip(ifd_data['strip_offsets'], ifd_data['strip_byte_counts']))
+        image = np.frombuffer(pixels, dtype=self.dtype, count=self.width * self.height).reshape(
+            [self.height, self.width])
+        if ifd_data['predictor'] == 2:
+            # horizontal differencing: each pixel is stored as the difference from the one to its left
+            return np.cumsum(image, axis=1, dtype=self.dtype)
+        # the decompressed bytes are immutable
+        return image.copy()
+
+    def read_image(self, channel_index, z_index, t_index, pos_index, read_metadata=False, memmapped=False,
+                   lazy=False):
+        """
+        :param memmapped: return a view of the pixels in the memory map rather than a copy. Ignored for compressed
+            images, which are always decompressed into memory
+        :param lazy: return the metadata as a _LazyMetadata that only decodes the keys looked up, rather than a dict
+        """
+        ifd_offset, pixels_offset, _ = self.index[channel_index, z_index, t_index, pos_index]
+        if self.compression != self.NO_COMPRESSION:
+            image = self._read_compressed_image(ifd_offset)
+            if read_metadata:
+                return image, self.read_metadata(channel_index, z_index, t_index, pos_index, lazy)
+            return image
         image = np.reshape(self.np_memmap[pixels_offset: pixels_offset + self.width * self.height *
                                     (2 if self.dtype == np.uint16 else 1)].view(self.dtype), [self.height, self.width])
         if not memmapped:
@@ -191,60 +700,159 @@ class _MultipageTiffReader:
         # image = self._read_pixels(ifd_data['pixel_offset'], ifd_data['bytes_per_image'], memmapped)
         if read_metadata:
             ifd_data = self._read_ifd(ifd_offset)
-            metadata = json.loads(self._read(ifd_data['md_offset'], ifd_data['md_offset'] + ifd_data['md_length']))
+            raw = self._read(ifd_data['md_offset'], ifd_data['md_offset'] + ifd_data['md_length'])
+            metadata = _LazyMetadata(raw) if lazy else json.loads(raw)
             return image, metadata
         return image
 
     def check_ifd(self, channel_index, z_index, t_index, pos_index):
-        ifd_offset, pixels_offset = self.index_tree[channel_index][z_index][t_index][pos_index]
-        try:
-            ifd_data = self._read_ifd(ifd_offset)
-            return True
-        except:
-            return False
+        return bool(self.valid_images()[self.index[channel_index, z_index, t_index, pos_index][2]])
+
+    def valid_images(self):
+        """
+        :return: boolean array that is True for each row of the index map whose image can be read, checked on first use
+        """
+        if self._valid_images is None:
+            self._valid_images = self._check_ifds()
+        return self._valid_images
+
+    def _gather(self, byte_offsets, length):
+        """
+        Read the same number of bytes starting at each of many byte offsets in one vectorized operation. Bytes past the
+        end of the file are read as the last byte of the file
+
+        :return: len(byte_offsets) x length uint8 array
+        """
+        byte_indices = np.minimum(byte_offsets[:, None] + np.arange(length), self.np_memmap.size - 1)
+        return np.ascontiguousarray(self.np_memmap[byte_indices])
+
+    def _check_ifds(self, index_map=None):
+        """
+        Check the IFDs of all images in the index map at once. An image is valid if its IFD lies within the file and has
+        strip offset and strip byte count tags, and its pixels lie within the file
+
+        :param index_map: entries to check, by default the whole index map
+        :return: boolean array with one entry per row of the index map
+        """
+        if index_map is None:
+            index_map = self.index_map
+        ifd_data = self._read_ifds(index_map['ifd_offset'])
+        return ifd_data['valid'] & (ifd_data['pixel_offset'] + ifd_data['bytes_per_image'] <= self.np_memmap.size)
 
 class _ResolutionLevel:
 
-    def __init__(self, path, count, max_count):
+    def __init__(self, path, count, max_count, cached_headers=None, num_threads=1, live=False, handle_pool=None):
         """
-        open all tiff files in directory, keep them in a list, and a tree based on image indices
+        open all tiff files in directory, keep them in a list, and a dict mapping image indices to readers
         :param path:
+        :param cached_headers: optional dict mapping tiff paths to previously parsed headers
+        :param num_threads: number of threads used to open and parse tiff files concurrently. 1 opens them serially
+        :param live: the dataset is still being written, so skip files whose header hasn't been written yet and try them
+            again on refresh
+        :param handle_pool: optional _HandlePool shared by the readers of every file
         """
+        if cached_headers is None:
+            cached_headers = {}
+        self.path = path
+        self.live = live
+        self.handle_pool = handle_pool
         tiff_names = [os.path.join(path, tiff) for tiff in os.listdir(path) if tiff.endswith('.tif')]
+        if num_threads > 1:
+            with ThreadPoolExecutor(max_workers=num_threads) as executor:
+                futures = [executor.submit(self._open_reader, tiff, cached_headers.get(tiff)) for tiff in tiff_names]
+                for _ in as_completed(futures):
+                    print('\rOpening file {} of {}'.format(count + 1, max_count), end='')
+                    count += 1
+                readers = [future.result() for future in futures]
+        else:
+            readers = []
+            for tiff in tiff_names:
+                print('\rOpening file {} of {}'.format(count+1, max_count), end='')
+                count += 1
+                readers.append(self._open_reader(tiff, cached_headers.get(tiff)))
         self.reader_list = []
-        self.reader_tree = {}
-        #populate list of readers and tree mapping indices to readers
-        for tiff in tiff_names:
-            print('\rOpening file {} of {}'.format(count+1, max_count), end='')
-            count += 1
-            reader = _MultipageTiffReader(tiff)
-            self.reader_list.append(reader)
-            it = reader.index_tree
-            for c in it.keys():
-                if c not in self.reader_tree.keys():
-                    self.reader_tree[c] = {}
-                for z in it[c].keys():
-                    if z not in self.reader_tree[c].keys():
-                        self.reader_tree[c][z] = {}
-                    for t in it[c][z].keys():
-                        if t not in self.reader_tree[c][z].keys():
-                            self.reader_tree[c][z][t] = {}
-                        for p in it[c][z][t].keys():
-                            self.reader_tree[c][z][t][p] = reader
-
-    def read_image(self, channel_index=0, z_index=0, t_index=0, pos_index=0, read_metadata=False, memmapped=False):
+        # map from (channel_index, z_index, t_index, pos_index) to the reader containing that image
+        self.reader_index = {}
+        #populate list of readers and index mapping indices to readers, in the same order regardless of threading
+        for reader in readers:
+            if reader is not None:
+                self.reader_list.append(reader)
+                self.reader_index.update(dict.fromkeys(reader.index, reader))
+
+    def _open_reader(self, tiff, cached_header=None):
+        try:
+            return _MultipageTiffReader(tiff, cached_header, self.handle_pool)
+        except Exception:
+            if not self.live:
+                raise
+            # the writer has created the file but not finished its header
+            return None
+
+    def refresh(self):
+        """
+        Pick up images added to open files and open any files created since this level was opened or last refreshed
+
+        :return: list of (channel_index, z_index, t_index, pos_index) tuples of the new images
+        """
+        new_keys = []
+        for reader in self.reader_list:
+            keys = reader.refresh()
+            self.reader_index.update(dict.fromkeys(keys, reader))
+            new_keys.extend(keys)
+        open_paths = {reader.tiff_path for reader in self.reader_list}
+        for tiff in sorted(os.listdir(self.path)):
+            tiff = os.path.join(self.path, tiff)
+            if not tiff.endswith('.tif') or tiff in open_paths:
+                continue
+            reader = self._open_reader(tiff)
+            if reader is not None:
+                self.reader_list.append(reader)
+                self.reader_index.update(dict.fromkeys(reader.index, reader))
+                new_keys.extend(reader.index)
+        return new_keys
+
+    def image_keys(self):
+        """
+        :return: n x 4 array of the (channel_index, z_index, t_index, pos_index) of every image, read from the index
+            maps of the files without going through reader_index
+        """
+        if not self.reader_list:
+            return np.zeros((0, 4), dtype=np.int64)
+        index_map = np.concatenate([reader.index_map for reader in self.reader_list])
+        return np.stack([index_map[field] for field in _MultipageTiffReader._AXES_FIELDS], axis=1).astype(np.int64)
+
+    def read_image(self, channel_index=0, z_index=0, t_index=0, pos_index=0, read_metadata=False, memmapped=False,
+                   lazy=False):
         # determine which reader contains the image
-        reader = self.reader_tree[channel_index][z_index][t_index][pos_index]
-        return reader.read_image(channel_index, z_index, t_index, pos_index, read_metadata, memmapped)
+        reader = self.reader_index[channel_index, z_index, t_index, pos_index]
+        return reader.read_image(channel_index, z_index, t_index, pos_index, read_metadata, memmapped, lazy)
 
-    def read_metadata(self, channel_index=0, z_index=0, t_index=0, pos_index=0):
+    def read_metadata(self, channel_index=0, z_index=0, t_index=0, pos_index=0, lazy=False):
         # determine which reader contains the image
-        reader = self.reader_tree[channel_index][z_index][t_index][pos_index]
-        return reader.read_metadata(channel_index, z_index, t_index, pos_index)
+        reader = self.reader_index[channel_index, z_index, t_index, pos_index]
+        return reader.read_metadata(channel_index, z_index, t_index, pos_index, lazy)
+
+    def read_metadata_batch(self, indices, lazy=False):
+        """
+        Read the metadata of many images, decoding the IFDs of each file in one pass
+
+        :param indices: list of (channel_index, z_index, t_index, pos_index) tuples
+        :param lazy: return _LazyMetadata that only decode the keys looked up, rather than dicts
+        :return: list of metadata dicts in the same order
+        """
+        # group by the reader that contains each image
+        reader_indices = {}
+        for i, image_index in enumerate(indices):
+            reader_indices.setdefault(self.reader_index[image_index], []).append(i)
+        metadata = [None] * len(indices)
+        for reader, positions in reader_indices.items():
+            for i, md in zip(positions, reader.read_metadata_batch([indices[i] for i in positions], lazy)):
+                metadata[i] = md
+        return metadata
 
     def check_ifd(self, channel_index=0, z_index=0, t_index=0, pos_index=0):
         # determine which reader contains the image
-        reader = self.reader_tree[channel_index][z_index][t_index][pos_index]
+        reader = self.reader_index[channel_index, z_index, t_index, pos_index]
         return reader.check_ifd(channel_index, z_index, t_index, pos_index)
 
     def close(self):
@@ -252,6 +860,240 @@ class _ResolutionLevel:
             reader.close()
 
 
+class _LazyResolutionLevels(dict):
+    """
+    Dict mapping downsample factors to _ResolutionLevels that opens the lower resolution levels of a dataset the first
+    time each one is looked up, rather than when the dataset is opened
+    """
+
+    def __init__(self, dataset_path, live=False, handle_pool=None):
+        super().__init__()
+        self.path = dataset_path
+        self.live = live
+        self.handle_pool = handle_pool
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def __missing__(self, downsample_factor):
+        res_dir_path = os.path.join(self.path, 'Downsampled_x{}'.format(downsample_factor))
+        if downsample_factor == 1 or not os.path.isdir(res_dir_path):
+            raise KeyError(downsample_factor)
+        with self._lock:
+            # another thread may have opened it in the meantime
+            if downsample_factor not in self:
+                num_tiffs = len([file for file in os.listdir(res_dir_path) if file.endswith('.tif')])
+                self[downsample_factor] = _ResolutionLevel(res_dir_path, 0, num_tiffs, live=self.live,
+                                                           handle_pool=self.handle_pool)
+        return self[downsample_factor]
+
+    def open_all(self):
+        """
+        Open every lower resolution level in the dataset directory that isn't open yet
+        """
+        for res_dir in os.listdir(self.path):
+            if res_dir.startswith('Downsampled_x') and os.path.isdir(os.path.join(self.path, res_dir)):
+                self[int(res_dir.split('x')[1])]
+
+
+class _HandlePool:
+    """
+    Limits how many TIFF files, and memory maps of them, are open at once. Readers are opened the first time they're
+    accessed, and the least recently used are closed once more than the limit are open, to be reopened if accessed
+    again. Safe to use from multiple threads
+    """
+
+    def __init__(self, max_open):
+        """
+        :param max_open: maximum number of readers with open files, at least 1
+        """
+        if max_open < 1:
+            raise Exception('max_open_files must be at least 1, or None to keep every file open')
+        self.max_open = max_open
+        self.opens = 0
+        self.evictions = 0
+        self._open_readers = OrderedDict()
+        self._lock = threading.Lock()
+
+    def touch(self, reader, remap=False):
+        """
+        Open a reader if it isn't already open, and mark it as the most recently used
+
+        :param remap: map the file again even if it's open, to include anything written since it was mapped
+        :return: the reader's memory map
+        """
+        with self._lock:
+            if reader in self._open_readers:
+                self._open_readers.move_to_end(reader)
+                if remap:
+                    reader._open()
+                return reader._np_memmap
+            reader._open()
+            self.opens += 1
+            self._open_readers[reader] = None
+            while len(self._open_readers) > self.max_open:
+                evicted, _ = self._open_readers.popitem(last=False)
+                evicted._close_handles()
+                self.evictions += 1
+            return reader._np_memmap
+
+    def discard(self, reader):
+        with self._lock:
+            self._open_readers.pop(reader, None)
+
+    def __getstate__(self):
+        # a copy in another process starts with nothing open
+        return {'max_open': self.max_open}
+
+    def __setstate__(self, state):
+        self.__init__(state['max_open'])
+
+
+class _TileCache:
+    """
+    Least recently used cache of decoded tiles and parsed metadata, which evicts entries once the total number of bytes
+    they hold exceeds a budget. Safe to use from multiple threads
+    """
+
+    def __init__(self, max_bytes):
+        """
+        :param max_bytes: byte budget. 0 disables the cache
+        """
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        :return: the cached value, or None if the key isn't in the cache
+        """
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key][0]
+
+    def put(self, key, value, nbytes):
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, nbytes)
+            self.current_bytes += nbytes
+            while self.current_bytes > self.max_bytes:
+                self.current_bytes -= self._entries.popitem(last=False)[1][1]
+
+    def invalidate(self, keys=None):
+        """
+        :param keys: keys to remove from the cache, or None to remove everything
+        """
+        with self._lock:
+            if keys is None:
+                self._entries.clear()
+                self.current_bytes = 0
+                return
+            for key in keys:
+                if key in self._entries:
+                    self.current_bytes -= self._entries.pop(key)[1]
+
+    def __getstate__(self):
+        # a copy in another process starts out empty
+        return {'max_bytes': self.max_bytes}
+
+    def __setstate__(self, state):
+        self.__init__(state['max_bytes'])
+
+
+class _ImageBlockReader:
+    """
+    Array-like view of all the tiles of a Dataset with one leading dimension per axis followed by y and x, for building a
+    dask array with da.from_array. Tiles are only read when a block of the array is requested, and positions with no
+    image in the dataset are filled with zeros. If stitched, y and x span the whole grid of positions, and blocks are
+    read with Dataset.read_region
+    """
+
+    def __init__(self, dataset, axes, downsample_factor=1, stitched=False):
+        """
+        :param dataset: the Dataset to read from
+        :param axes: dict mapping axis names to lists of axis values, in the order of the leading dimensions. Must not
+            contain position if stitched
+        :param downsample_factor: 1 is full resolution, lower resolutions are powers of 2 if available
+        :param stitched: lay out tiles acquired in a grid next to one another, with their overlap cropped
+        """
+        self.dataset = dataset
+        self.axes = axes
+        self.downsample_factor = downsample_factor
+        self.stitched = stitched
+        if stitched:
+            image_shape = dataset._stitched_shape(downsample_factor)
+        else:
+            tile_reader = dataset.res_levels[downsample_factor].reader_list[0]
+            image_shape = (tile_reader.height, tile_reader.width)
+        self.dtype = np.dtype(dataset.dtype)
+        self.shape = tuple(len(values) for values in axes.values()) + tuple(image_shape)
+        self.ndim = len(self.shape)
+
+    def __getitem__(self, key):
+        key = key if isinstance(key, tuple) else (key,)
+        if Ellipsis in key:
+            ellipsis_index = key.index(Ellipsis)
+            key = key[:ellipsis_index] + (slice(None),) * (self.ndim - len(key) + 1) + key[ellipsis_index + 1:]
+        key = key + (slice(None),) * (self.ndim - len(key))
+        # indices along each leading dimension, which is dropped if its key is an integer
+        selected = [np.arange(size)[axis_key] for size, axis_key in zip(self.shape[:-2], key[:-2])]
+        tile_key = key[-2:]
+        tile_shape = np.broadcast_to(np.zeros((), self.dtype), self.shape[-2:])[tile_key].shape
+        block = np.zeros(tuple(np.size(indices) for indices in selected) + tile_shape, dtype=self.dtype)
+
+        def read_tile(block_index):
+            image_axes = {axis: values[np.atleast_1d(indices)[i]] for (axis, values), indices, i in
+                          zip(self.axes.items(), selected, block_index)}
+            if self.stitched:
+                block[block_index] = self._read_stitched(image_axes, tile_key)
+                return
+            tile = self.dataset._read_image_if_present(image_axes, self.downsample_factor)
+            if tile is not None:
+                block[block_index] = tile[tile_key]
+
+        block_indices = list(np.ndindex(*block.shape[:len(selected)]))
+        if self.dataset._num_decode_threads > 1 and len(block_indices) > 1:
+            # mostly useful for compressed images, which are decompressed outside of the global interpreter lock
+            with ThreadPoolExecutor(max_workers=self.dataset._num_decode_threads) as executor:
+                list(executor.map(read_tile, block_indices))
+        else:
+            for block_index in block_indices:
+                read_tile(block_index)
+        return block.reshape(sum((np.shape(indices) for indices in selected), ()) + tile_shape)
+
+    def _read_stitched(self, image_axes, yx_key):
+        """
+        Read the part of the stitched image selected by integer or slice keys for y and x
+        """
+        yx_indices = [np.arange(size)[axis_key] for size, axis_key in zip(self.shape[-2:], yx_key)]
+        if any(np.size(indices) == 0 for indices in yx_indices):
+            return np.zeros([np.size(indices) for indices in yx_indices if np.ndim(indices)], dtype=self.dtype)
+        (y, x), (y_end, x_end) = [[int(f(indices)) for indices in yx_indices] for f in (np.min, np.max)]
+        region = self.dataset.read_region(y, x, y_end - y + 1, x_end - x + 1,
+                                          downsample_factor=self.downsample_factor, **image_axes)
+        # region is the bounding box of the selection, so stepping from its start (or end, for negative steps) selects
+        # the right pixels
+        return region[tuple(slice(None, None, axis_key.step) if isinstance(axis_key, slice) else 0
+                            for axis_key in yx_key)]
+
+
 class Dataset:
     """
     Class that opens a single NDTiffStorage dataset
@@ -263,13 +1105,82 @@ class Dataset:
     _CHANNEL_AXIS = 'channel'
 
 
-    def __init__(self, dataset_path, full_res_only=True):
+    # name of the optional sidecar file, written next to the resolution directories, that caches the parsed index
+    # of every TIFF along with the axes and grid layout of the dataset
+    _INDEX_CACHE_FILE = '.pycromanager_index_cache.npz'
+    _INDEX_CACHE_VERSION = 3
+    # name of the sidecar file caching the result of reduce, filled in with the axis, operation and, for lower
+    # resolutions, '_x' and the downsample factor
+    _REDUCE_CACHE_FILE = '.pycromanager_reduce_{}_{}{}.npz'
+    # name of the sidecar file storing the histograms computed by statistics, filled in with how they're grouped
+    _STATISTICS_FILE = '.pycromanager_statistics_{}.npz'
+    # attributes that a dataset opened with lazy=True reads from image metadata on first use
+    _LAZY_AXES_ATTRIBUTES = ('axes', '_all_axes', '_channel_names', '_extra_axes_to_storage_channel')
+
+    def __init__(self, dataset_path, full_res_only=True, cache_index=False, num_open_threads=1, tile_cache_bytes=0,
+                 live=False, max_open_files=None, num_decode_threads=1, lazy=False):
+        """
+        :param dataset_path: path to the top level of the dataset (i.e. the one that contains the Full resolution folder)
+        :param full_res_only: if True, don't open the downsampled resolution levels
+        :param cache_index: if True, read the index of each TIFF file, the axes, channel names and grid layout from a
+            sidecar cache file in the dataset directory if one exists and the files haven't changed since it was
+            written, and write one otherwise. This makes reopening the same dataset much faster
+        :type cache_index: boolean
+        :param num_open_threads: number of threads used to open and parse the TIFF files of each resolution level
+            concurrently. 1 opens them one at a time
+        :type num_open_threads: int
+        :param tile_cache_bytes: size in bytes of an in-memory least recently used cache of tiles and metadata shared by
+            read_image, read_metadata and arrays from as_array. 0 disables it
+        :type tile_cache_bytes: int
+        :param live: open a dataset that is still being acquired. Call refresh to pick up images written since it was
+            opened
+        :type live: boolean
+        :param max_open_files: maximum number of TIFF files, across all resolution levels, kept open and memory mapped
+            at once. Files are then opened when first read from and the least recently used are closed as others are
+            opened. Must be at least 1. None keeps every file open, which is fastest if the operating system allows it
+        :type max_open_files: int
+        :param num_decode_threads: number of threads that read, and decompress if compressed, the images of each chunk
+            of arrays from as_array(block_reader=True) and of each call to read_images
+        :type num_decode_threads: int
+        :param lazy: only read the index maps of the full resolution files when opening. The axes and channel names are
+            read from image metadata the first time they're needed, the grid layout of tiled datasets the first time
+            it's needed, and lower resolution levels (unless full_res_only) are opened the first time they're read
+            from. Much faster to open large datasets that are only partly read
+        :type lazy: boolean
+        """
         self.path = dataset_path
-        res_dirs = [dI for dI in os.listdir(dataset_path) if os.path.isdir(os.path.join(dataset_path, dI))]
+        self._full_res_only = full_res_only
+        self._live = live
+        self._handle_pool = _HandlePool(max_open_files) if max_open_files is not None else None
+        self._num_decode_threads = num_decode_threads
+        self._tile_cache = _TileCache(tile_cache_bytes)
+        # columns of read_metadata_table kept in memory for each downsample factor
+        self._metadata_table_cache = {}
+        # row_col_array of each lower resolution, read when first stitched
+        self._downsampled_row_col_arrays = {}
+        # part of the names of dask arrays, so arrays of different Dataset objects at the same path don't share keys
+        self._token = uuid.uuid4().hex
+        # other directories, such as a resolution level still being built, are ignored
+        res_dirs = [dI for dI in os.listdir(dataset_path) if os.path.isdir(os.path.join(dataset_path, dI)) and
+                    (dI == 'Full resolution' or dI.startswith('Downsampled_x'))]
         # map from downsample factor to datset
         self.res_levels = {}
         if 'Full resolution' not in res_dirs:
             raise Exception('Couldn\'t find full resolution directory. Is this the correct path to a dataset?')
+        if lazy and not full_res_only:
+            self.res_levels = _LazyResolutionLevels(dataset_path, live, self._handle_pool)
+        if full_res_only or lazy:
+            # only count and open the files of the levels opened now
+            res_dirs = ['Full resolution']
+        cached_headers, cached_layout = self._read_index_cache() if cache_index else ({}, None)
+        # whether everything opened was read from the cache, in which case it doesn't need to be rewritten
+        cache_is_current = True
+        # set when the axes or grid layout are left to be read on first use
+        self._axes_pending = False
+        self._grid_layout_pending = False
+        # held while reading them, which can happen on any thread. Reentrant because reading the grid layout reads
+        # the axes
+        self._lazy_lock = threading.RLock()
         num_tiffs = 0
         count = 0
         for res_dir in res_dirs:
@@ -277,17 +1188,17 @@ class Dataset:
                 if file.endswith('.tif'):
                     num_tiffs += 1
         for res_dir in res_dirs:
-            if full_res_only and res_dir != 'Full resolution':
-                continue
             res_dir_path = os.path.join(dataset_path, res_dir)
-            res_level = _ResolutionLevel(res_dir_path, count, num_tiffs)
+            res_level = _ResolutionLevel(res_dir_path, count, num_tiffs, cached_headers, num_open_threads, live,
+                                         self._handle_pool)
+            cache_is_current = cache_is_current and all(reader.tiff_path in cached_headers for reader in res_level.reader_list)
             if res_dir == 'Full resolution':
                 #TODO: might want to move this within the resolution level class to facilitate loading pyramids
                 self.res_levels[1] = res_level
-                # get summary metadata and index tree from full resolution image
+                if not res_level.reader_list:
+                    raise Exception('No images have been written to the dataset yet')
+                # get summary metadata and index from full resolution image
                 self.summary_metadata = res_level.reader_list[0].summary_md
-                self._channel_names = {} #read them from image metadata
-                self._extra_axes_to_storage_channel = {}
 
                 # store some fields explicitly for easy access
                 self.dtype = np.uint16 if self.summary_metadata['PixelType'] == 'GRAY16' else np.uint8
@@ -297,68 +1208,277 @@ class Dataset:
                 self.image_height = res_level.reader_list[0].height
                 self.overlap = np.array([self.summary_metadata['GridPixelOverlapY'],  self.summary_metadata[
                     'GridPixelOverlapX']]) if 'GridPixelOverlapY' in self.summary_metadata else None
-                c_z_t_p_tree = res_level.reader_tree
-                #the c here refers to super channels, encompassing all non-tzp axes in addition to channels
-                # map of axis names to values where data exists
-                self.axes = {self._Z_AXIS: set(), self._TIME_AXIS: set(), self._POSITION_AXIS: set(), self._CHANNEL_AXIS: set()}
-                for c in c_z_t_p_tree.keys():
-                    for z in c_z_t_p_tree[c]:
-                        self.axes[self._Z_AXIS].add(z)
-                        for t in c_z_t_p_tree[c][z]:
-                            self.axes[self._TIME_AXIS].add(t)
-                            for p in c_z_t_p_tree[c][z][t]:
-                                self.axes[self._POSITION_AXIS].add(p)
-                                if c not in self.axes['channel']:
-                                    metadata = self.res_levels[1].read_metadata(channel_index=c, z_index=z,
-                                                                                t_index=t, pos_index=p)
-                                    current_axes = metadata['Axes']
-                                    non_zpt_axes = {}
-                                    for axis in current_axes:
-                                        if axis not in [self._Z_AXIS, self._TIME_AXIS, self._POSITION_AXIS]:
-                                            if axis not in self.axes:
-                                                self.axes[axis] = set()
-                                            self.axes[axis].add(current_axes[axis])
-                                            non_zpt_axes[axis] = current_axes[axis]
-
-                                    self._channel_names[metadata['Channel']] = non_zpt_axes[self._CHANNEL_AXIS]
-                                    self._extra_axes_to_storage_channel[frozenset(non_zpt_axes.items())] = c
-
-                #remove axes with no variation
-                single_axes = [axis for axis in self.axes if len(self.axes[axis]) == 1]
-                for axis in single_axes:
-                    del self.axes[axis]
-
-                if 'position' in self.axes and 'GridPixelOverlapX' in self.summary_metadata:
-                    #Make an n x 2 array with nan's where no positions actually exist
-                    row_cols = []
-                    positions_checked = []
-                    for c_index in c_z_t_p_tree.keys():
-                        for z_index in c_z_t_p_tree[c_index].keys():
-                            for t_index in c_z_t_p_tree[c_index][z_index].keys():
-                                p_indices = c_z_t_p_tree[c_index][z_index][t_index].keys()
-                                for p_index in range(max(p_indices) + 1):
-                                    if p_index in positions_checked:
-                                        continue
-                                    if p_index not in p_indices:
-                                        row_cols.append(np.array([np.nan, np.nan]))
-                                    elif not res_level.check_ifd(channel_index=c_index, z_index=z_index, t_index=t_index, pos_index=p_index):
-                                        row_cols.append(np.array([np.nan, np.nan])) #this position is corrupted
-                                        warnings.warn('Corrupted image p: {} c: {} t: {} z: {}'.format(p_index, c_index, t_index, z_index))
-                                        row_cols.append(np.array([np.nan, np.nan]))
-                                    else:
-                                        md = res_level.read_metadata(channel_index=c_index, pos_index=p_index, t_index=t_index, z_index=z_index)
-                                        row_cols.append(np.array([md['GridRowIndex'], md['GridColumnIndex']]))
-                                    positions_checked.append(p_index)
-                    self.row_col_array = np.stack(row_cols)
 
+                full_res_files = sorted(os.path.relpath(reader.tiff_path, self.path) for reader in res_level.reader_list)
+                if cache_is_current and cached_layout is not None and cached_layout['full_res_files'] == full_res_files:
+                    self._load_cached_layout(cached_layout)
+                elif lazy:
+                    cache_is_current = False
+                    self._axes_pending = True
+                    self._grid_layout_pending = True
+                else:
+                    cache_is_current = False
+                    self._read_axes(res_level)
+                    self._read_grid_layout()
             else:
                 self.res_levels[int(res_dir.split('x')[1])] = res_level
+        if cache_index and not cache_is_current:
+            self._write_index_cache()
         print('\rDataset opened')
 
-    def as_array(self, stitched=False):
+    def __getattr__(self, name):
+        # only called for attributes that haven't been set, which includes those a dataset opened with lazy=True reads
+        # on first use
+        state = self.__dict__
+        if name in self._LAZY_AXES_ATTRIBUTES and state.get('_axes_pending'):
+            with self._lazy_lock:
+                # another thread may have read them while this one waited
+                if state['_axes_pending']:
+                    self._read_axes(self.res_levels[1])
+                    # only cleared once they're all set, so that other threads wait for them rather than finding them
+                    # missing
+                    state['_axes_pending'] = False
+            return getattr(self, name)
+        if name == 'row_col_array' and state.get('_grid_layout_pending'):
+            with self._lazy_lock:
+                if state['_grid_layout_pending']:
+                    self._read_grid_layout()
+                    state['_grid_layout_pending'] = False
+            return getattr(self, name)
+        raise AttributeError('\'{}\' object has no attribute \'{}\''.format(type(self).__name__, name))
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lazy_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lazy_lock = threading.RLock()
+
+    def _read_axes(self, res_level):
+        """
+        Populate self.axes, self._channel_names and self._extra_axes_to_storage_channel by reading the metadata of the
+        first image of each storage channel
+        """
+        #the c here refers to super channels, encompassing all non-tzp axes in addition to channels
+        # map of axis names to values where data exists, including axes with only one value
+        all_axes = {self._Z_AXIS: set(), self._TIME_AXIS: set(), self._POSITION_AXIS: set(), self._CHANNEL_AXIS: set()}
+        # channel names are read from image metadata
+        self._add_to_axes(res_level, res_level.image_keys(), all_axes, {}, {})
+
+    def _read_grid_layout(self):
+        """
+        Read row_col_array if the dataset was acquired in a grid of XY positions
+        """
+        if self._POSITION_AXIS in self.axes and 'GridPixelOverlapX' in self.summary_metadata:
+            self.row_col_array = self._read_row_col_array(self.res_levels[1])
+
+    def _add_to_axes(self, res_level, image_keys, all_axes=None, channel_names=None,
+                     extra_axes_to_storage_channel=None):
+        """
+        Add the axis values of images to the axes, reading the metadata of the first image of each storage channel not
+        seen before in one batch. The axes are filled in on copies that replace the old ones once complete, so that
+        other threads never see them half read
+
+        :param image_keys: (channel_index, z_index, t_index, pos_index) tuples of the images, or an n x 4 array of them
+        :param all_axes: map of axis names to sets of values to add to, along with channel_names and
+            extra_axes_to_storage_channel, instead of copies of the dataset's own
+        """
+        if all_axes is None:
+            all_axes = {axis: set(values) for axis, values in self._all_axes.items()}
+            channel_names = dict(self._channel_names)
+            extra_axes_to_storage_channel = dict(self._extra_axes_to_storage_channel)
+        image_keys = np.asarray(image_keys, dtype=np.int64).reshape(-1, 4)
+        for column, axis in enumerate([self._Z_AXIS, self._TIME_AXIS, self._POSITION_AXIS], start=1):
+            all_axes[axis].update(np.unique(image_keys[:, column]).tolist())
+        storage_channels_read = set(extra_axes_to_storage_channel.values())
+        storage_channels, first_rows = np.unique(image_keys[:, 0], return_index=True)
+        new_keys = [tuple(image_keys[row].tolist()) for c, row in zip(storage_channels.tolist(), first_rows.tolist())
+                    if c not in storage_channels_read]
+        for (c, _, _, _), metadata in zip(new_keys, res_level.read_metadata_batch(new_keys, lazy=True)):
+            current_axes = metadata['Axes']
+            non_zpt_axes = {}
+            for axis in current_axes:
+                if axis not in [self._Z_AXIS, self._TIME_AXIS, self._POSITION_AXIS]:
+                    if axis not in all_axes:
+                        all_axes[axis] = set()
+                    all_axes[axis].add(current_axes[axis])
+                    non_zpt_axes[axis] = current_axes[axis]
+
+            channel_names[metadata['Channel']] = non_zpt_axes[self._CHANNEL_AXIS]
+            extra_axes_to_storage_channel[frozenset(non_zpt_axes.items())] = c
+
+        #remove axes with no variation
+        axes = {axis: values for axis, values in all_axes.items() if len(values) > 1}
+        self.__dict__.update({'_all_axes': all_axes, '_channel_names': channel_names,
+                              '_extra_axes_to_storage_channel': extra_axes_to_storage_channel, 'axes': axes})
+
+    def _read_row_col_array(self, res_level, image_keys=None, row_col_array=None):
+        """
+        Read the grid row and column of each position from image metadata, reading the metadata of the first image at
+        each position in one batch
+
+        :param image_keys: (channel_index, z_index, t_index, pos_index) tuples of the images to find positions in, or
+            an n x 4 array of them, by default every image in res_level
+        :param row_col_array: previously read array to add positions that it doesn't have yet to
+        :return: n x 2 array with nan's where no positions actually exist
+        """
+        if image_keys is None:
+            image_keys = res_level.image_keys()
+        image_keys = np.asarray(image_keys, dtype=np.int64).reshape(-1, 4)
+        if row_col_array is None:
+            row_col_array = np.zeros((0, 2))
+        # the first image found at each position not read yet, which is used to read its row and column
+        positions, first_rows = np.unique(image_keys[:, 3], return_index=True)
+        already_read = positions < row_col_array.shape[0]
+        already_read[already_read] = np.logical_not(np.isnan(row_col_array[positions[already_read], 0]))
+        positions, first_rows = positions[~already_read], first_rows[~already_read]
+        if not positions.size:
+            return row_col_array
+        row_cols = np.full((max(positions[-1] + 1, row_col_array.shape[0]), 2), np.nan)
+        row_cols[:row_col_array.shape[0]] = row_col_array
+        position_keys = []
+        for c_index, z_index, t_index, p_index in image_keys[first_rows].tolist():
+            if not res_level.check_ifd(channel_index=c_index, z_index=z_index, t_index=t_index, pos_index=p_index):
+                #this position is corrupted
+                warnings.warn('Corrupted image p: {} c: {} t: {} z: {}'.format(p_index, c_index, t_index, z_index))
+            else:
+                position_keys.append((c_index, z_index, t_index, p_index))
+        for key, md in zip(position_keys, res_level.read_metadata_batch(position_keys, lazy=True)):
+            row_cols[key[3]] = [md['GridRowIndex'], md['GridColumnIndex']]
+        return row_cols
+
+    def refresh(self):
+        """
+        Pick up images written since the dataset was opened or last refreshed. Only the newly written images are read,
+        so this can be called repeatedly while a dataset opened with live=True is being acquired. Resolution levels
+        created since the last refresh are opened unless the dataset was opened with full_res_only, or with lazy, in
+        which case they're opened when first read from. Images written again replace their tile cache entries
+
+        :return: number of new full resolution images
+        :rtype: int
+        """
+        if not self._live:
+            raise Exception('Dataset must be opened with live=True to refresh')
+        new_keys = self.res_levels[1].refresh()
+        new_keys_by_level = {1: new_keys}
+        for downsample_factor, res_level in list(self.res_levels.items()):
+            if res_level is not self.res_levels[1]:
+                new_keys_by_level[downsample_factor] = res_level.refresh()
+        # images can be written again (e.g. by an acquisition that overwrites them), in which case cached copies of the
+        # old ones are stale
+        self._tile_cache.invalidate([(kind, downsample_factor) + tuple(key)
+                                     for downsample_factor, keys in new_keys_by_level.items() for key in keys
+                                     for kind in ('image', 'metadata')])
+        if not self._full_res_only and not isinstance(self.res_levels, _LazyResolutionLevels):
+            for res_dir in os.listdir(self.path):
+                res_dir_path = os.path.join(self.path, res_dir)
+                if res_dir.startswith('Downsampled_x') and os.path.isdir(res_dir_path) and \
+                        int(res_dir.split('x')[1]) not in self.res_levels:
+                    num_tiffs = len([file for file in os.listdir(res_dir_path) if file.endswith('.tif')])
+                    self.res_levels[int(res_dir.split('x')[1])] = _ResolutionLevel(
+                        res_dir_path, 0, num_tiffs, live=True, handle_pool=self._handle_pool)
+        if not new_keys:
+            return 0
+        # results derived from the old set of images
+        self._metadata_table_cache.clear()
+        self._downsampled_row_col_arrays.clear()
+
+        if self._axes_pending:
+            # the new images are included when the axes and grid layout are first read
+            return len(new_keys)
+        self._add_to_axes(self.res_levels[1], new_keys)
+        if self._grid_layout_pending:
+            return len(new_keys)
+        if 'position' in self.axes and 'GridPixelOverlapX' in self.summary_metadata:
+            if hasattr(self, 'row_col_array'):
+                self.row_col_array = self._read_row_col_array(self.res_levels[1], new_keys, self.row_col_array)
+            else:
+                self.row_col_array = self._read_row_col_array(self.res_levels[1])
+        return len(new_keys)
+
+    def _read_index_cache(self):
+        """
+        Read the sidecar index cache, if there is one
+
+        :return: dict mapping TIFF paths to (summary metadata, index map, first IFD offset, BigTIFF flag) for files
+            whose size and modification time still match the cache, and the cached axes and grid layout (or None)
+        """
+        cache_path = os.path.join(self.path, self._INDEX_CACHE_FILE)
+        if not os.path.isfile(cache_path):
+            return {}, None
+        try:
+            with np.load(cache_path, allow_pickle=False) as cache:
+                header = json.loads(cache['header'].tobytes())
+                if header['version'] != self._INDEX_CACHE_VERSION:
+                    return {}, None
+                cached_headers = {}
+                for rel_path, entry in header['files'].items():
+                    tiff_path = os.path.join(self.path, rel_path)
+                    if not os.path.isfile(tiff_path):
+                        continue
+                    stat = os.stat(tiff_path)
+                    if stat.st_size == entry['size'] and stat.st_mtime_ns == entry['mtime_ns']:
+                        cached_headers[tiff_path] = (entry['summary_md'], cache[entry['index_map']],
+                                                     entry['first_ifd_offset'], entry['big_tiff'])
+                layout = header['layout']
+                if layout is not None and layout['has_row_col_array']:
+                    layout['row_col_array'] = cache['row_col_array']
+        except Exception as e:
+            warnings.warn('Couldn\'t read index cache {}: {}'.format(cache_path, e))
+            return {}, None
+        return cached_headers, layout
+
+    def _load_cached_layout(self, layout):
+        self._all_axes = {axis: set(values) for axis, values in layout['axes'].items()}
+        self.axes = {axis: values for axis, values in self._all_axes.items() if len(values) > 1}
+        self._channel_names = layout['channel_names']
+        self._extra_axes_to_storage_channel = {frozenset(tuple(item) for item in non_zpt_axes): c
+                                               for non_zpt_axes, c in layout['extra_axes_to_storage_channel']}
+        if layout['has_row_col_array']:
+            self.row_col_array = layout['row_col_array']
+
+    def _write_index_cache(self):
+        """
+        Write the index of every open TIFF file along with the axes and grid layout to the sidecar cache file
+        """
+        files = {}
+        arrays = {}
+        for res_level in self.res_levels.values():
+            for reader in res_level.reader_list:
+                stat = os.stat(reader.tiff_path)
+                array_name = 'index_map_{}'.format(len(arrays))
+                arrays[array_name] = reader.index_map
+                files[os.path.relpath(reader.tiff_path, self.path)] = {
+                    'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'summary_md': reader.summary_md,
+                    'first_ifd_offset': int(reader.first_ifd_offset), 'big_tiff': bool(reader.big_tiff),
+                    'index_map': array_name}
+        layout = {'axes': {axis: sorted(values) for axis, values in self._all_axes.items()},
+                  'channel_names': self._channel_names,
+                  'extra_axes_to_storage_channel': [[sorted(non_zpt_axes), c] for non_zpt_axes, c in
+                                                    self._extra_axes_to_storage_channel.items()],
+                  'full_res_files': sorted(os.path.relpath(reader.tiff_path, self.path)
+                                           for reader in self.res_levels[1].reader_list),
+                  'has_row_col_array': hasattr(self, 'row_col_array')}
+        if layout['has_row_col_array']:
+            arrays['row_col_array'] = self.row_col_array
+        header = {'version': self._INDEX_CACHE_VERSION, 'files': files, 'layout': layout}
+        arrays['header'] = np.frombuffer(json.dumps(header).encode(), dtype=np.uint8)
+        cache_path = os.path.join(self.path, self._INDEX_CACHE_FILE)
+        try:
+            # write to a temporary file first so that a partially written cache is never read
+            with open(cache_path + '.tmp', 'wb') as f:
+                np.savez(f, **arrays)
+            os.replace(cache_path + '.tmp', cache_path)
+        except OSError as e:
+            warnings.warn('Couldn\'t write index cache {}: {}'.format(cache_path, e))
+
+    def as_array(self, stitched=False, block_reader=False, chunks=None):
         """
         Read all data image data as one big Dask array with last two axes as y, x and preceeding axes depending on data.
         The dask array is made up of memory-mapped numpy arrays, so the dataset does not need to be able to fit into RAM.
+        Compressed images are instead read and decompressed when the chunks of the array they're in are computed.
         If the data doesn't fully fill out the array (e.g. not every z-slice collected at every time point), zeros will
         be added automatically.
 
@@ -367,17 +1487,34 @@ class Dataset:
 
         :param stitched: If true and tiles were acquired in a grid, lay out adjacent tiles next to one another
         :type stitched: boolean
+        :param block_reader: If true, build the array from a single lazy block reader instead of one memory-mapped
+            array per tile. The time and memory needed to build the array then don't grow with the number of tiles. If
+            also stitched, the overlap between adjacent tiles is cropped and each chunk in y and x is one cropped tile,
+            so only the tiles in view are read. The array is also cheap to send to other processes, so it works well
+            with dask's multiprocessing and distributed schedulers
+        :type block_reader: boolean
+        :param chunks: Only used with block_reader. dict mapping axis names to the number of images along that axis in
+            each chunk, which defaults to 1. -1 puts the whole axis in one chunk, e.g. {'z': -1} for a z-stack per chunk
+        :type chunks: dict
         :return:
         """
+        if block_reader:
+            return self._as_block_reader_array(chunks, stitched=stitched)
+
         self._empty_tile = np.zeros((self.image_height, self.image_width), self.dtype)
         self._count = 1
         total = np.prod([len(v) for v in self.axes.values()])
+        # compressed tiles can't be memory mapped, so they're only read and decompressed when their chunk is computed
+        compressed = any(reader.compression != reader.NO_COMPRESSION for reader in self.res_levels[1].reader_list)
 
         def recurse_axes(loop_axes, point_axes):
             if len(loop_axes.values()) == 0:
                 print('\rAdding data chunk {} of {}'.format(self._count, total), end='')
                 self._count += 1
                 if None not in point_axes.values() and self.has_image(**point_axes):
+                    if compressed:
+                        return da.from_delayed(dask.delayed(self.read_image)(**point_axes),
+                                               shape=self._empty_tile.shape, dtype=self.dtype)
                     return self.read_image(**point_axes, memmapped=True)
                 else:
                     # return np.zeros((self.image_height, self.image_width), self.dtype)
@@ -400,7 +1537,7 @@ class Dataset:
                     cols = zero_min_row_col[positions_indices][:, 1]
                     # mask in case some positions were corrupted
                     mask = np.logical_not(np.isnan(rows))
-                    row_col_mat[rows[mask].astype(np.int), cols[mask].astype(np.int)] = positions_indices[mask]
+                    row_col_mat[rows[mask].astype(int), cols[mask].astype(int)] = positions_indices[mask]
 
                     blocks = []
                     for row in row_col_mat:
@@ -409,7 +1546,7 @@ class Dataset:
                             print('\rAdding data chunk {} of {}'.format(self._count, total), end='')
                             valed_axes = point_axes.copy()
                             valed_axes[axis] = int(p_index) if not np.isnan(p_index) else None
-                            blocks[-1].append(da.stack(recurse_axes(remaining_axes, valed_axes)))
+                            blocks[-1].append(da.asarray(recurse_axes(remaining_axes, valed_axes)))
 
                     stitched_array = da.block(blocks)
                     return stitched_array
@@ -419,14 +1556,390 @@ class Dataset:
                         valed_axes = point_axes.copy()
                         valed_axes[axis] = val
                         blocks.append(recurse_axes(remaining_axes, valed_axes))
-                    return blocks
+                    # stacked one axis at a time, since da.stack would read a nested list of tiles into memory
+                    return da.stack(blocks)
         blocks = recurse_axes(self.axes, {})
 
         print('Stacking tiles')
-        array = da.stack(blocks)
+        array = da.asarray(blocks)
         print('\rDask array opened')
         return array
 
+    def as_multiscale(self, stitched=False, chunks=None):
+        """
+        Read each resolution level of the dataset as a lazily loaded Dask array, for viewers such as napari that can
+        render zoomed out views from the lower resolutions. The dataset must have been opened with full_res_only=False
+        to include any levels besides full resolution. Arrays are built as in as_array with block_reader=True, and all
+        have the same leading axes as Dataset.axes followed by y and x
+
+        :param stitched: If true and tiles were acquired in a grid, lay out adjacent tiles next to one another
+        :type stitched: boolean
+        :param chunks: dict mapping axis names to the number of images along that axis in each chunk, as in as_array
+        :type chunks: dict
+        :return: list of dask arrays, from full resolution to the lowest resolution
+        """
+        if isinstance(self.res_levels, _LazyResolutionLevels):
+            self.res_levels.open_all()
+        return [self._as_block_reader_array(chunks, downsample_factor, stitched)
+                for downsample_factor in sorted(self.res_levels.keys())]
+
+    def to_zarr(self, store, chunks=None, compressor='default', num_threads=4):
+        """
+        Export the full resolution images to a zarr group, with the images in an array named 'data' with the same axes
+        as as_array and the summary metadata, axes and channel names as attributes of the group. Images are streamed
+        in the order they're stored on disk and written concurrently, and an interrupted export resumes when called
+        again with the same store. Requires zarr. Can also be run as python -m pycromanager.export
+
+        :param store: zarr store or path to write to
+        :param chunks: dict mapping axis names to the number of images along that axis in each chunk, which defaults to
+            1. -1 puts the whole axis in one chunk, e.g. {'z': -1} for a z-stack per chunk
+        :type chunks: dict
+        :param compressor: compressor passed on to zarr, None for no compression or 'default' for zarr's default
+        :param num_threads: number of threads reading and writing chunks
+        :type num_threads: int
+        :return: the zarr group
+        """
+        from pycromanager.export import export_zarr
+        return export_zarr(self, store, chunks, compressor, num_threads)
+
+    def reduce(self, axis='z', op='max', downsample_factor=1, num_threads=1, cache=False):
+        """
+        Project the dataset along one axis, e.g. a maximum intensity projection along z or a mean over time. Images are
+        read in the order they're stored on disk and combined into a single accumulator per output image, so memory
+        use doesn't depend on the length of the axis being reduced
+
+        :param axis: name of the axis to reduce along, one of the axes in Dataset.axes
+        :type axis: str
+        :param op: 'max', 'min', 'sum' or 'mean'. Images missing from the dataset, or corrupted, are left out rather
+            than counted as zeros
+        :type op: str
+        :param downsample_factor: 1 is full resolution, lower resolutions are powers of 2 if available
+        :param num_threads: number of output images computed concurrently
+        :type num_threads: int
+        :param cache: if True, save the result to a sidecar file in the dataset directory and load it from there on
+            later calls, for as long as the files of the dataset don't change
+        :type cache: boolean
+        :return: numpy array with the axes of as_array other than the one reduced (in the same order), followed by y
+            and x. Has the dtype of the dataset for max and min, int64 for sum and float64 for mean
+        """
+        if op not in ('max', 'min', 'sum', 'mean'):
+            raise Exception('Unknown reduction: {}'.format(op))
+        if axis not in self.axes:
+            raise Exception('Unknown axis: {}'.format(axis))
+        resolution = '_x{}'.format(downsample_factor) if downsample_factor != 1 else ''
+        cache_path = os.path.join(self.path, self._REDUCE_CACHE_FILE.format(axis, op, resolution))
+        files = self._file_signatures(downsample_factor)
+        if cache and os.path.isfile(cache_path):
+            try:
+                with np.load(cache_path, allow_pickle=False) as cached:
+                    if json.loads(cached['files'].tobytes()) == files:
+                        return cached['result']
+            except Exception as e:
+                warnings.warn('Couldn\'t read cached reduction {}: {}'.format(cache_path, e))
+
+        output_axes = {name: {value: i for i, value in enumerate(sorted(values))} for name, values in self.axes.items()
+                       if name != axis}
+        tile_reader = self.res_levels[downsample_factor].reader_list[0]
+        accumulator_dtype = {'max': self.dtype, 'min': self.dtype, 'sum': np.int64, 'mean': np.float64}[op]
+        result = np.zeros(tuple(len(values) for values in output_axes.values()) + (tile_reader.height,
+                          tile_reader.width), dtype=accumulator_dtype)
+        # images contributing to each output image, in storage order
+        output_images = {}
+        for key, reader, image_axes in self._images_in_storage_order(downsample_factor):
+            output_index = tuple(values[image_axes[name]] for name, values in output_axes.items())
+            output_images.setdefault(output_index, []).append((key, reader))
+        ufunc = {'max': np.maximum, 'min': np.minimum, 'sum': np.add, 'mean': np.add}[op]
+
+        def reduce_images(output_index):
+            accumulator = result[output_index]
+            images = output_images[output_index]
+            for i, (key, reader) in enumerate(images):
+                image = reader.read_image(*key, memmapped=True)
+                if i == 0:
+                    accumulator[:] = image
+                else:
+                    ufunc(accumulator, image, out=accumulator)
+            if op == 'mean':
+                accumulator /= len(images)
+
+        if num_threads > 1:
+            with ThreadPoolExecutor(max_workers=num_threads) as executor:
+                list(executor.map(reduce_images, output_images))
+        else:
+            for output_index in output_images:
+                reduce_images(output_index)
+
+        if cache:
+            try:
+                with open(cache_path + '.tmp', 'wb') as f:
+                    np.savez(f, result=result, files=np.frombuffer(json.dumps(files).encode(), dtype=np.uint8))
+                os.replace(cache_path + '.tmp', cache_path)
+            except OSError as e:
+                warnings.warn('Couldn\'t write cached reduction {}: {}'.format(cache_path, e))
+        return result
+
+    def statistics(self, per_timepoint=False, percentiles=(0.1, 1, 50, 99, 99.9), contrast_limits=(0.1, 99.9),
+                   downsample_factor=1, num_threads=1, recompute=False):
+        """
+        Compute the pixel value histogram of each channel (or of each channel at each time point) along with its min,
+        max, percentiles and display contrast limits. The histograms are computed exactly in a single pass over every
+        image and saved to a sidecar file in the dataset directory, so later calls, even after reopening the dataset,
+        return immediately for as long as the files of the dataset don't change. Corrupted images, such as those cut off
+        at the end of a file by a crashed acquisition, are left out of the histograms
+
+        :param per_timepoint: compute separate statistics for every time point rather than one set per channel
+        :type per_timepoint: boolean
+        :param percentiles: percentiles (0 to 100) of the pixel values to report
+        :param contrast_limits: the lower and upper percentile used as display contrast limits
+        :param downsample_factor: 1 is full resolution, lower resolutions are powers of 2 if available. Statistics of a
+            lower resolution are much faster to compute and usually close enough for choosing contrast limits
+        :param num_threads: number of files read concurrently
+        :type num_threads: int
+        :param recompute: ignore previously saved histograms
+        :type recompute: boolean
+        :return: dict mapping channel names (or (channel name, time index) tuples if per_timepoint) to dicts with
+            'histogram' (number of pixels with each value, indexed by value), 'min', 'max', 'percentiles' (dict mapping
+            each percentile to a pixel value) and 'contrast_limits' (tuple of the lower and upper limit)
+        """
+        grouping = 'per_timepoint' if per_timepoint else 'per_channel'
+        if downsample_factor != 1:
+            grouping += '_x{}'.format(downsample_factor)
+        stats_path = os.path.join(self.path, self._STATISTICS_FILE.format(grouping))
+        files = self._file_signatures(downsample_factor)
+        histograms = None
+        if not recompute and os.path.isfile(stats_path):
+            try:
+                with np.load(stats_path, allow_pickle=False) as saved:
+                    header = json.loads(saved['header'].tobytes())
+                    if header['files'] == files:
+                        histograms = dict(zip([tuple(group) for group in header['groups']], saved['histograms']))
+            except Exception as e:
+                warnings.warn('Couldn\'t read saved statistics {}: {}'.format(stats_path, e))
+        if histograms is None:
+            histograms = self._compute_histograms(per_timepoint, downsample_factor, num_threads)
+            header = {'files': files, 'groups': [list(group) for group in histograms]}
+            try:
+                with open(stats_path + '.tmp', 'wb') as f:
+                    np.savez_compressed(f, histograms=np.stack(list(histograms.values())),
+                                        header=np.frombuffer(json.dumps(header).encode(), dtype=np.uint8))
+                os.replace(stats_path + '.tmp', stats_path)
+            except OSError as e:
+                warnings.warn('Couldn\'t save statistics {}: {}'.format(stats_path, e))
+
+        channel_names = {index: name for name, index in self._channel_names.items()}
+        statistics = {}
+        for (channel, time), histogram in sorted(histograms.items()):
+            cumulative = np.cumsum(histogram)
+            present = np.flatnonzero(histogram)
+            # lowest value with at least the given fraction of pixels at or below it
+            percentile_values = {p: int(np.searchsorted(cumulative, max(p / 100 * cumulative[-1], 1))) for p in
+                                 set(percentiles) | set(contrast_limits)}
+            group = (channel_names[channel], time) if per_timepoint else channel_names[channel]
+            statistics[group] = {'histogram': histogram, 'min': int(present[0]), 'max': int(present[-1]),
+                                 'percentiles': {p: percentile_values[p] for p in percentiles},
+                                 'contrast_limits': tuple(percentile_values[p] for p in contrast_limits)}
+        return statistics
+
+    def _compute_histograms(self, per_timepoint, downsample_factor, num_threads):
+        """
+        :return: dict mapping (channel axis value, time index or None) to a histogram of pixel values with one bin per
+            possible value, counting only images that aren't corrupted
+        """
+        num_bins = 256 if self.dtype == np.uint8 else 65536
+        images_by_reader = {}
+        for key, reader, image_axes in self._images_in_storage_order(downsample_factor):
+            group = (image_axes.get(self._CHANNEL_AXIS, 0), image_axes[self._TIME_AXIS] if per_timepoint else None)
+            images_by_reader.setdefault(reader, []).append((key, group))
+
+        def file_histograms(reader):
+            histograms = {}
+            for key, group in images_by_reader[reader]:
+                image = reader.read_image(*key, memmapped=True)
+                counts = np.bincount(image.ravel(), minlength=num_bins)
+                if group in histograms:
+                    histograms[group] += counts
+                else:
+                    histograms[group] = counts
+            return histograms
+
+        if num_threads > 1:
+            with ThreadPoolExecutor(max_workers=num_threads) as executor:
+                results = list(executor.map(file_histograms, images_by_reader))
+        else:
+            results = [file_histograms(reader) for reader in images_by_reader]
+        histograms = {}
+        for result in results:
+            for group, counts in result.items():
+                if group in histograms:
+                    histograms[group] += counts
+                else:
+                    histograms[group] = counts
+        return histograms
+
+    def _file_signatures(self, downsample_factor=1):
+        """
+        :return: dict mapping the path of each TIFF file of a resolution level, relative to the dataset, to its size and
+            modification time, for checking whether results derived from the files are still current
+        """
+        return {os.path.relpath(reader.tiff_path, self.path): [os.stat(reader.tiff_path).st_size,
+                                                               os.stat(reader.tiff_path).st_mtime_ns]
+                for reader in self.res_levels[downsample_factor].reader_list}
+
+    def _as_block_reader_array(self, chunks=None, downsample_factor=1, stitched=False):
+        """
+        Create a dask array over all tiles with one chunk per block of images read by an _ImageBlockReader
+        """
+        if chunks is None:
+            chunks = {}
+        axes = {axis: sorted(values) for axis, values in self.axes.items()
+                if not (stitched and axis == self._POSITION_AXIS)}
+        reader = _ImageBlockReader(self, axes, downsample_factor, stitched)
+        if stitched:
+            yx_chunks = tuple(self._stitched_layout(downsample_factor)[1])
+        else:
+            yx_chunks = reader.shape[-2:]
+        array_chunks = tuple(chunks.get(axis, 1) for axis in axes) + yx_chunks
+        # the file signatures change as images are written, so arrays made before and after a refresh don't share keys
+        name = 'dataset-' + dask.base.tokenize(self._token, self._file_signatures(downsample_factor), axes,
+                                               downsample_factor, stitched, array_chunks)
+        return da.from_array(reader, chunks=array_chunks, name=name, asarray=False, fancy=False,
+                             meta=np.empty((0,) * reader.ndim, dtype=self.dtype))
+
+    def _stitched_layout(self, downsample_factor=1):
+        """
+        Work out how tiles acquired in a grid fit together into a stitched image, in which the overlap between adjacent
+        tiles is split evenly between them and cropped
+
+        :return: 2D array of the position index at each grid row and column (-1 where there is no position), the
+            (height, width) of a cropped tile, and the (y, x) offset of the cropped part within a tile
+        """
+        if self._POSITION_AXIS not in self.axes or not hasattr(self, 'row_col_array'):
+            raise Exception('Dataset was not acquired in a grid of XY positions')
+        if downsample_factor == 1:
+            row_col_array = self.row_col_array
+        else:
+            # positions of lower resolutions are laid out on their own, coarser grid
+            if downsample_factor not in self._downsampled_row_col_arrays:
+                self._downsampled_row_col_arrays[downsample_factor] = self._read_row_col_array(
+                    self.res_levels[downsample_factor])
+            row_col_array = self._downsampled_row_col_arrays[downsample_factor]
+        zero_min_row_col = row_col_array - np.nanmin(row_col_array, axis=0)
+        present = np.flatnonzero(np.logical_not(np.isnan(zero_min_row_col[:, 0])))
+        position_grid = -np.ones([int(np.nanmax(zero_min_row_col[:, 0])) + 1,
+                                  int(np.nanmax(zero_min_row_col[:, 1])) + 1], dtype=int)
+        position_grid[zero_min_row_col[present, 0].astype(int), zero_min_row_col[present, 1].astype(int)] = present
+        tile_reader = self.res_levels[downsample_factor].reader_list[0]
+        tile_shape = np.array([tile_reader.height, tile_reader.width])
+        overlap = self.overlap if self.overlap is not None else np.zeros(2, dtype=int)
+        if downsample_factor != 1:
+            if np.all(tile_shape == np.array([self.image_height, self.image_width]) - overlap):
+                # Micro-Magellan stores lower resolutions as tiles with the overlap already removed
+                overlap = np.zeros(2, dtype=int)
+            else:
+                # lower resolutions made by downsampling each tile keep a proportionally smaller overlap
+                overlap = overlap // downsample_factor
+        return position_grid, tile_shape - overlap, overlap // 2
+
+    def _stitched_shape(self, downsample_factor=1):
+        position_grid, cropped_tile_shape, _ = self._stitched_layout(downsample_factor)
+        return tuple(int(n) for n in np.array(position_grid.shape) * cropped_tile_shape)
+
+    def read_region(self, y, x, height, width, channel=None, z=None, time=None, channel_name=None,
+                    downsample_factor=1, **kwargs):
+        """
+        Read a rectangular region of the stitched image of a dataset acquired in a grid of XY positions, in which the
+        overlap between adjacent tiles is cropped. Only the tiles that intersect the region are read
+
+        :param y: row of the top left corner of the region in the stitched image
+        :type y: int
+        :param x: column of the top left corner of the region in the stitched image
+        :type x: int
+        :param height: height of the region in pixels
+        :type height: int
+        :param width: width of the region in pixels
+        :type width: int
+        :param channel: index of the channel, if applicable
+        :type channel: int
+        :param z: index of z slice, if applicable
+        :type z: int
+        :param time: index of the time point, if applicable
+        :type time: int
+        :param channel_name: Name of the channel. Overrides channel index if supplied
+        :param downsample_factor: 1 is full resolution, lower resolutions are powers of 2 if available. y, x, height
+            and width are in pixels of the stitched image at that resolution
+        :param kwargs: names and integer positions of any other axes
+        :return: height x width numpy array, with zeros where no tile was acquired
+        """
+        if channel is not None:
+            kwargs['channel'] = channel
+        if z is not None:
+            kwargs['z'] = z
+        if time is not None:
+            kwargs['time'] = time
+        if channel_name is not None:
+            kwargs['channel_name'] = channel_name
+
+        position_grid, cropped_tile_shape, crop_offset = self._stitched_layout(downsample_factor)
+        region = np.zeros((height, width), dtype=self.dtype)
+        tile_height, tile_width = [int(n) for n in cropped_tile_shape]
+        rows = range(max(y // tile_height, 0), min((y + height - 1) // tile_height + 1, position_grid.shape[0]))
+        cols = range(max(x // tile_width, 0), min((x + width - 1) // tile_width + 1, position_grid.shape[1]))
+        for row in rows:
+            for col in cols:
+                if position_grid[row, col] < 0:
+                    continue
+                tile = self._read_image_if_present(dict(kwargs, position=int(position_grid[row, col])),
+                                                   downsample_factor)
+                if tile is None:
+                    continue
+                # intersection of the region and the cropped tile in stitched image coordinates
+                y_start, y_end = max(y, row * tile_height), min(y + height, (row + 1) * tile_height)
+                x_start, x_end = max(x, col * tile_width), min(x + width, (col + 1) * tile_width)
+                tile_y = y_start - row * tile_height + int(crop_offset[0])
+                tile_x = x_start - col * tile_width + int(crop_offset[1])
+                region[y_start - y:y_end - y, x_start - x:x_end - x] = \
+                    tile[tile_y:tile_y + y_end - y_start, tile_x:tile_x + x_end - x_start]
+        return region
+
+    def _read_image_if_present(self, axes, downsample_factor=1):
+        """
+        Read a memory-mapped image given a dict of axis values, or return None if there is no image at those axes
+        """
+        try:
+            present = self.has_image(**axes, downsample_factor=downsample_factor)
+        except KeyError:
+            # combination of non-zpt axes that was never acquired
+            present = False
+        if not present:
+            return None
+        return self.read_image(**axes, downsample_factor=downsample_factor, memmapped=True)
+
+    def _images_in_storage_order(self, downsample_factor=1):
+        """
+        List every image of a resolution level in the order it's stored on disk: file by file, and by byte offset within
+        each file. Corrupted images, such as those cut off at the end of a file by a crashed acquisition, are left out
+        with a warning
+
+        :return: list of ((channel_index, z_index, t_index, pos_index), reader, dict of the image's axis values) tuples
+        """
+        storage_channel_axes = {c: dict(non_zpt_axes) for non_zpt_axes, c in
+                                self._extra_axes_to_storage_channel.items()}
+        images = []
+        num_corrupted = 0
+        for reader in self.res_levels[downsample_factor].reader_list:
+            valid = reader.valid_images().tolist()
+            for key, (_, _, row) in sorted(reader.index.items(), key=lambda item: item[1][0]):
+                if not valid[row]:
+                    num_corrupted += 1
+                    continue
+                c, z, t, p = key
+                axes = dict(storage_channel_axes.get(c, {}))
+                axes.update({self._Z_AXIS: z, self._TIME_AXIS: t, self._POSITION_AXIS: p})
+                images.append((key, reader, axes))
+        if num_corrupted:
+            warnings.warn('Skipping {} corrupted images'.format(num_corrupted))
+        return images
+
     def _convert_to_storage_axes(self, axes, channel_name=None):
         """
         Convert an abitrary set of axes to cztp axes as in the underlying storage
@@ -481,15 +1994,13 @@ class Dataset:
             kwargs['position'] = position
 
         storage_c_index, t_index, p_index, z_index = self._convert_to_storage_axes(kwargs, channel_name=channel_name)
-        c_z_t_p_tree = self.res_levels[downsample_factor].reader_tree
-        if storage_c_index in c_z_t_p_tree and z_index in c_z_t_p_tree[storage_c_index] and  t_index in \
-                c_z_t_p_tree[storage_c_index][z_index] and p_index in c_z_t_p_tree[storage_c_index][z_index][t_index]:
-            res_level = self.res_levels[downsample_factor]
+        res_level = self.res_levels[downsample_factor]
+        if (storage_c_index, z_index, t_index, p_index) in res_level.reader_index:
             return res_level.check_ifd(channel_index=storage_c_index, z_index=z_index, t_index=t_index, pos_index=p_index)
         return False
 
     def read_image(self, channel=None, z=None, time=None, position=None,
-                   channel_name=None, read_metadata=False, downsample_factor=1, memmapped=False, **kwargs):
+                   channel_name=None, read_metadata=False, downsample_factor=1, memmapped=False, lazy=False, **kwargs):
         """
         Read image data as numpy array
 
@@ -503,6 +2014,9 @@ class Dataset:
         :type position: int
         :param channel_name: Name of the channel. Overrides channel index if supplied
         :param downsample_factor: 1 is full resolution, lower resolutions are powers of 2 if available
+        :param lazy: with read_metadata, return the metadata as a read-only mapping that only decodes the values of the
+            keys looked up, as in read_metadata. Bypasses the tile cache for the metadata
+        :type lazy: boolean
         :param kwargs: names and integer positions of any other axes
         :return: image as 2D numpy array, or tuple with image and image metadata as dict
         """
@@ -517,10 +2031,171 @@ class Dataset:
 
         storage_c_index, t_index, p_index, z_index = self._convert_to_storage_axes(kwargs, channel_name=channel_name)
         res_level = self.res_levels[downsample_factor]
-        return res_level.read_image(storage_c_index, z_index, t_index, p_index, read_metadata, memmapped)
+        if self._tile_cache.max_bytes == 0:
+            return res_level.read_image(storage_c_index, z_index, t_index, p_index, read_metadata, memmapped, lazy)
+        image_key = (downsample_factor, storage_c_index, z_index, t_index, p_index)
+        image = self._tile_cache.get(('image',) + image_key)
+        if image is None:
+            image = res_level.read_image(storage_c_index, z_index, t_index, p_index)
+            # cached tiles are shared, so make sure they can't be modified in place
+            image.flags.writeable = False
+            self._tile_cache.put(('image',) + image_key, image, image.nbytes)
+        if not memmapped:
+            image = np.copy(image)
+        if read_metadata and lazy:
+            return image, res_level.read_metadata(storage_c_index, z_index, t_index, p_index, lazy)
+        if read_metadata:
+            return image, self._read_metadata_cached(res_level, image_key)
+        return image
+
+    def iter_images(self, order='storage', prefetch=16, read_metadata=False, downsample_factor=1):
+        """
+        Iterate over every image in the dataset. In storage order, files are read through from start to end, which is
+        much faster than reading images in axis order on spinning disks and network drives. A background thread reads
+        ahead of the images being yielded, and asks the operating system to start reading further ahead. Corrupted
+        images, such as those cut off at the end of a file by a crashed acquisition, are skipped with a warning
+
+        :param order: 'storage' for the order images are stored on disk, or a list of axis names from outermost to
+            innermost loop, e.g. ['time', 'position', 'z', 'channel']. Axes not in the list vary fastest
+        :param prefetch: number of images read ahead by the background thread. 0 reads each image as it's yielded
+        :type prefetch: int
+        :param read_metadata: also yield the metadata of each image
+        :type read_metadata: boolean
+        :param downsample_factor: 1 is full resolution, lower resolutions are powers of 2 if available
+        :return: generator of (axes, image) tuples, or (axes, image, metadata) if read_metadata, where axes is a dict
+            mapping the names of the axes in Dataset.axes to the image's value along each
+        """
+        images = self._images_in_storage_order(downsample_factor)
+        if order != 'storage':
+            # sorting is stable, so images tied on the given axes stay in storage order
+            images.sort(key=lambda image: tuple(image[2].get(axis, 0) for axis in order))
+
+        def read(key, reader, image_axes):
+            axes = {axis: image_axes[axis] for axis in self.axes if axis in image_axes}
+            image = reader.read_image(*key)
+            if read_metadata:
+                return axes, image, reader.read_metadata(*key)
+            return axes, image
+
+        if prefetch <= 0:
+            for image in images:
+                yield read(*image)
+            return
+
+        def advise(i):
+            key, reader, _ = images[i]
+            pixel_offset = reader.index[key][1]
+            reader.advise_willneed(pixel_offset, pixel_offset + reader.width * reader.height *
+                                   np.dtype(reader.dtype).itemsize)
+
+        prefetched = queue.Queue(maxsize=prefetch)
+        stop = threading.Event()
+
+        def put(result):
+            """
+            :return: False if the consumer stopped early while waiting for room in the queue
+            """
+            while not stop.is_set():
+                try:
+                    prefetched.put(result, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def prefetch_images():
+            try:
+                for i in range(min(prefetch, len(images))):
+                    advise(i)
+                for i, image in enumerate(images):
+                    if i + prefetch < len(images):
+                        advise(i + prefetch)
+                    if not put((read(*image), None)):
+                        return
+            except Exception as e:
+                put((None, e))
+                return
+            put((None, None))
+
+        thread = threading.Thread(target=prefetch_images, name='Image prefetch', daemon=True)
+        thread.start()
+        try:
+            while True:
+                result, error = prefetched.get()
+                if error is not None:
+                    raise error
+                if result is None:
+                    return
+                yield result
+        finally:
+            stop.set()
+            thread.join()
+
+    def read_images(self, indices, out=None, roi=None, stride=None, downsample_factor=1):
+        """
+        Read many images into one N x height x width array in a single pass. Reads are ordered by file and position
+        within the file, and only the pixels selected by roi and stride are copied from each image
+
+        :param indices: list of dicts mapping axis names to values, one per image, as for the keyword arguments of
+            read_image (e.g. [{'z': 0}, {'z': 1}], or with a 'channel_name' key)
+        :type indices: list
+        :param out: optional preallocated array of the right shape and dtype to read into
+        :type out: numpy array
+        :param roi: optional (y, x, height, width) region of each image to read
+        :type roi: tuple
+        :param stride: optional (y, x) step between pixels read, e.g. (2, 2) for every other row and column
+        :type stride: tuple
+        :param downsample_factor: 1 is full resolution, lower resolutions are powers of 2 if available
+        :return: the array of images, in the same order as indices
+        """
+        res_level = self.res_levels[downsample_factor]
+        tile_shape = (res_level.reader_list[0].height, res_level.reader_list[0].width)
+        y, x, height, width = roi if roi is not None else (0, 0) + tile_shape
+        step_y, step_x = stride if stride is not None else (1, 1)
+        tile_key = (slice(y, y + height, step_y), slice(x, x + width, step_x))
+        shape = (len(indices),) + np.broadcast_to(np.zeros((), self.dtype), tile_shape)[tile_key].shape
+        if out is None:
+            out = np.empty(shape, dtype=self.dtype)
+        elif out.shape != shape or out.dtype != self.dtype:
+            raise Exception('out must have shape {} and dtype {}'.format(shape, np.dtype(self.dtype)))
+
+        image_keys = []
+        for axes in indices:
+            axes = dict(axes)
+            channel_name = axes.pop('channel_name', None)
+            storage_c_index, t_index, p_index, z_index = self._convert_to_storage_axes(axes, channel_name=channel_name)
+            image_keys.append((storage_c_index, z_index, t_index, p_index))
+        readers = [res_level.reader_index[image_key] for image_key in image_keys]
+        read_order = sorted(range(len(image_keys)),
+                            key=lambda i: (readers[i].tiff_path, readers[i].index[image_keys[i]][1]))
+
+        def read_tile(i):
+            tile = None
+            if self._tile_cache.max_bytes != 0:
+                tile = self._tile_cache.get(('image', downsample_factor) + image_keys[i])
+            if tile is None:
+                tile = readers[i].read_image(*image_keys[i], memmapped=True)
+            out[i] = tile[tile_key]
+
+        if self._num_decode_threads > 1:
+            with ThreadPoolExecutor(max_workers=self._num_decode_threads) as executor:
+                list(executor.map(read_tile, read_order))
+        else:
+            for i in read_order:
+                read_tile(i)
+        return out
+
+    def _read_metadata_cached(self, res_level, image_key):
+        metadata = self._tile_cache.get(('metadata',) + image_key)
+        if metadata is None:
+            metadata = res_level.read_metadata(*image_key[1:])
+            # approximate size, counting only the top level of the metadata
+            nbytes = sys.getsizeof(metadata) + sum(sys.getsizeof(value) for value in metadata.values())
+            self._tile_cache.put(('metadata',) + image_key, metadata, nbytes)
+        return dict(metadata)
 
     def read_metadata(self, channel=None, z=None, time=None, position=None,
-                        channel_name=None, downsample_factor=1, **kwargs):
+                        channel_name=None, downsample_factor=1, lazy=False, **kwargs):
         """
         Read metadata only. Faster than using read_image to retireve metadata
 
@@ -534,6 +2209,10 @@ class Dataset:
         :type position: int
         :param channel_name: Name of the channel. Overrides channel index if supplied
         :param downsample_factor: 1 is full resolution, lower resolutions are powers of 2 if available
+        :param lazy: return a read-only mapping that only decodes the values of the keys looked up, which is much
+            faster when only a few fields of large metadata (e.g. 'Axes' or 'ElapsedTime-ms') are needed. Bypasses the
+            tile cache
+        :type lazy: boolean
         :param kwargs: names and integer positions of any other axes
         :return: image metadata as dict
         """
@@ -548,10 +2227,130 @@ class Dataset:
 
         storage_c_index, t_index, p_index, z_index = self._convert_to_storage_axes(kwargs, channel_name=channel_name)
         res_level = self.res_levels[downsample_factor]
-        return res_level.read_metadata(storage_c_index, z_index, t_index, p_index)
+        if self._tile_cache.max_bytes == 0 or lazy:
+            return res_level.read_metadata(storage_c_index, z_index, t_index, p_index, lazy)
+        return self._read_metadata_cached(res_level, (downsample_factor, storage_c_index, z_index, t_index, p_index))
+
+    def cache_info(self):
+        """
+        Get statistics of the tile cache enabled by the tile_cache_bytes argument
+
+        :return: dict with the number of cache hits and misses, the number of cached entries and the bytes they hold,
+            and the byte budget
+        """
+        return {'hits': self._tile_cache.hits, 'misses': self._tile_cache.misses,
+                'entries': len(self._tile_cache._entries), 'bytes': self._tile_cache.current_bytes,
+                'max_bytes': self._tile_cache.max_bytes}
+
+    def handle_pool_info(self):
+        """
+        Get statistics of the limit on open files set by the max_open_files argument
+
+        :return: dict with the number of files currently open, the limit, and the number of times files have been
+            opened and closed to stay within the limit
+        """
+        if self._handle_pool is None:
+            return {'open': sum(len(res_level.reader_list) for res_level in self.res_levels.values()),
+                    'max_open': None, 'opens': None, 'evictions': None}
+        return {'open': len(self._handle_pool._open_readers), 'max_open': self._handle_pool.max_open,
+                'opens': self._handle_pool.opens, 'evictions': self._handle_pool.evictions}
+
+    def invalidate_cache(self, channel=None, z=None, time=None, position=None,
+                         channel_name=None, downsample_factor=1, **kwargs):
+        """
+        Remove one image and its metadata from the tile cache, or everything if no axes are given
+
+        :param channel: index of the channel, if applicable
+        :type channel: int
+        :param z: index of z slice, if applicable
+        :type z: int
+        :param time: index of the time point, if applicable
+        :type time: int
+        :param position: index of the XY position, if applicable
+        :type position: int
+        :param channel_name: Name of the channel. Overrides channel index if supplied
+        :param downsample_factor: 1 is full resolution, lower resolutions are powers of 2 if available
+        :param kwargs: names and integer positions of any other axes
+        """
+        if channel is not None:
+            kwargs['channel'] = channel
+        if z is not None:
+            kwargs['z'] = z
+        if time is not None:
+            kwargs['time'] = time
+        if position is not None:
+            kwargs['position'] = position
+        if not kwargs and channel_name is None:
+            self._tile_cache.invalidate()
+            return
+
+        storage_c_index, t_index, p_index, z_index = self._convert_to_storage_axes(kwargs, channel_name=channel_name)
+        image_key = (downsample_factor, storage_c_index, z_index, t_index, p_index)
+        self._tile_cache.invalidate([('image',) + image_key, ('metadata',) + image_key])
+
+    def read_metadata_table(self, keys, downsample_factor=1, num_threads=1, cache=False):
+        """
+        Read selected metadata fields of every image in the dataset as columns of numpy arrays. Much faster than calling
+        read_metadata on each image, because files are scanned in on-disk order with their IFDs decoded in bulk
+
+        :param keys: list of top level metadata keys to read, e.g. ['ElapsedTime-ms', 'XPosition_um']
+        :param downsample_factor: 1 is full resolution, lower resolutions are powers of 2 if available
+        :param num_threads: number of files scanned concurrently
+        :type num_threads: int
+        :param cache: if True, keep the columns in memory so that later calls asking for the same keys return immediately
+        :type cache: boolean
+        :return: dict mapping the name of each axis in Dataset.axes and each key to a 1D numpy array with one entry per
+            image, in the same image order for every column. Keys missing from some images, or images whose metadata is
+            corrupted, have nan (numeric values) or None (other values) in those entries
+        """
+        cached_columns = self._metadata_table_cache.setdefault(downsample_factor, {})
+        keys_to_read = [key for key in keys if key not in cached_columns]
+        if keys_to_read or not cached_columns:
+            columns = self._scan_metadata_table(keys_to_read, downsample_factor, num_threads)
+            if not cache:
+                cached_columns = dict(cached_columns)
+            cached_columns.update(columns)
+        return {name: cached_columns[name] for name in list(self.axes) + list(keys)}
+
+    def _scan_metadata_table(self, keys, downsample_factor, num_threads):
+        res_level = self.res_levels[downsample_factor]
+        readers = res_level.reader_list
+        if num_threads > 1:
+            with ThreadPoolExecutor(max_workers=num_threads) as executor:
+                results = list(executor.map(lambda reader: reader.read_metadata_fields(keys), readers))
+        else:
+            results = [reader.read_metadata_fields(keys) for reader in readers]
+        index_map = np.concatenate([result[0] for result in results])
+
+        columns = {self._Z_AXIS: index_map['z_index'], self._TIME_AXIS: index_map['t_index'],
+                   self._POSITION_AXIS: index_map['pos_index']}
+        # expand storage channels into the non-zpt axes they encompass
+        storage_channels, storage_channel_rows = np.unique(index_map['channel_index'], return_inverse=True)
+        storage_channel_axes = {c: dict(non_zpt_axes) for non_zpt_axes, c in self._extra_axes_to_storage_channel.items()}
+        for axis in self.axes:
+            if axis not in columns:
+                axis_values = [storage_channel_axes.get(c, {}).get(axis) for c in storage_channels.tolist()]
+                columns[axis] = self._to_column(axis_values)[storage_channel_rows]
+        for key in keys:
+            columns[key] = self._to_column([value for result in results for value in result[1][key]])
+        return {name: column for name, column in columns.items() if name in self.axes or name in keys}
+
+    @staticmethod
+    def _to_column(values):
+        """
+        Convert a list of values, some of which may be None, to a numpy array, using nan for missing numbers
+        """
+        present = [value for value in values if value is not None]
+        if len(present) == len(values):
+            return np.array(values)
+        if all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in present):
+            return np.array([np.nan if value is None else value for value in values], dtype=float)
+        column = np.empty(len(values), dtype=object)
+        column[:] = values
+        return column
 
     def close(self):
-        for res_level in self.res_levels:
+        for res_level in self.res_levels.values():
             res_level.close()
 
     def get_channel_names(self):
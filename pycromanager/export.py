@@ -0,0 +1,126 @@
+"""
+Export NDTiff datasets to other formats. Run as python -m pycromanager.export to convert a dataset from the command line
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import numpy as np
+from pycromanager.data import Dataset, _ImageBlockReader
+
+# names of the arrays in the zarr group written by export_zarr
+ZARR_DATA_ARRAY = 'data'
+# one element per chunk of the data array, set to 1 once the chunk is written. Removed when the export finishes
+ZARR_PROGRESS_ARRAY = 'export_progress'
+
+
+def _storage_order_chunks(dataset, axes, chunk_shape):
+    """
+    List the chunks of an export that contain at least one image, ordered by where their first image is stored on disk
+    so that each TIFF file is read through from start to end
+
+    :param axes: dict mapping axis names to sorted lists of axis values, in the order of the exported array
+    :param chunk_shape: number of images along each axis in each chunk
+    :return: list of chunk index tuples
+    """
+    axis_value_indices = {axis: {value: i for i, value in enumerate(values)} for axis, values in axes.items()}
+    # chunks in the order their first image is found
+    chunk_order = {}
+    for _, _, image_axes in dataset._images_in_storage_order():
+        chunk_index = tuple(axis_value_indices[axis][image_axes[axis]] // size
+                            for axis, size in zip(axes, chunk_shape))
+        chunk_order.setdefault(chunk_index, len(chunk_order))
+    return list(chunk_order)
+
+
+def export_zarr(dataset, store, chunks=None, compressor='default', num_threads=4, verbose=True):
+    """
+    Export the full resolution images of a dataset to a zarr group, with the images in an array named 'data' that has
+    the same axes as Dataset.as_array. The summary metadata, axis names and values and channel names (mapped to their
+    channel axis values) are stored as attributes of the group. Chunks are read in the order their images are stored
+    on disk and written by a pool of threads, with at most two chunks per thread in memory at a time. Chunks with no
+    images are left unwritten, so read as zeros. An export that was interrupted picks up where it left off when called
+    again with the same store
+
+    :param dataset: the Dataset to export
+    :type dataset: Dataset
+    :param store: zarr store or path to write to
+    :param chunks: dict mapping axis names to the number of images along that axis in each chunk, which defaults to 1.
+        -1 puts the whole axis in one chunk. Each chunk always spans whole images in y and x
+    :type chunks: dict
+    :param compressor: compressor passed on to zarr, None for no compression or 'default' for zarr's default
+    :param num_threads: number of threads reading and writing chunks
+    :type num_threads: int
+    :param verbose: print progress
+    :type verbose: boolean
+    :return: the zarr group
+    """
+    import zarr
+
+    if chunks is None:
+        chunks = {}
+    axes = {axis: sorted(values) for axis, values in dataset.axes.items()}
+    reader = _ImageBlockReader(dataset, axes)
+    chunk_shape = tuple(len(axes[axis]) if chunks.get(axis, 1) == -1 else chunks.get(axis, 1) for axis in axes)
+    chunk_grid_shape = tuple(int(np.ceil(len(values) / size)) for values, size in zip(axes.values(), chunk_shape))
+    root = zarr.open_group(store, mode='a')
+    if ZARR_DATA_ARRAY in root and ZARR_PROGRESS_ARRAY not in root:
+        # finished by an earlier call
+        return root
+    # the progress array is made first, so a data array without one is always complete
+    progress = root.require_dataset(ZARR_PROGRESS_ARRAY, shape=(int(np.prod(chunk_grid_shape)),),
+                                    chunks=(min(int(np.prod(chunk_grid_shape)), 65536),), dtype=np.uint8, fill_value=0)
+    compressor_kwargs = {} if compressor == 'default' else {'compressor': compressor}
+    data = root.require_dataset(ZARR_DATA_ARRAY, shape=reader.shape, chunks=chunk_shape + reader.shape[-2:],
+                                dtype=reader.dtype, fill_value=0, **compressor_kwargs)
+    root.attrs.update({'summary_metadata': dataset.summary_metadata,
+                       'axes': list(axes) + ['y', 'x'],
+                       'axis_values': axes,
+                       'channel_names': dataset._channel_names})
+
+    completed = progress[:]
+    to_write = [chunk_index for chunk_index in _storage_order_chunks(dataset, axes, chunk_shape)
+                if not completed[np.ravel_multi_index(chunk_index, chunk_grid_shape)]]
+
+    def write_chunk(chunk_index):
+        selection = tuple(slice(i * size, (i + 1) * size) for i, size in zip(chunk_index, chunk_shape))
+        data[selection] = reader[selection]
+        return chunk_index
+
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        pending = set()
+        for count, chunk_index in enumerate(to_write):
+            if len(pending) >= 2 * num_threads:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    # progress is only written from this thread, so concurrent writes to it can't clobber each other
+                    progress[np.ravel_multi_index(future.result(), chunk_grid_shape)] = 1
+            pending.add(executor.submit(write_chunk, chunk_index))
+            if verbose:
+                print('\rWriting chunk {} of {}'.format(count + 1, len(to_write)), end='')
+        for future in wait(pending).done:
+            progress[np.ravel_multi_index(future.result(), chunk_grid_shape)] = 1
+    del root[ZARR_PROGRESS_ARRAY]
+    if verbose:
+        print('\rExport finished in {:.1f} s'.format(time.time() - start))
+    return root
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export an NDTiff dataset to zarr')
+    parser.add_argument('dataset_path', help='top level of the dataset (i.e. the one that contains the Full resolution '
+                                             'folder)')
+    parser.add_argument('store', help='path of the zarr store to write. An interrupted export to the same path is '
+                                      'resumed')
+    parser.add_argument('--chunks', nargs='*', default=[], metavar='AXIS=SIZE',
+                        help='number of images per chunk along an axis, e.g. z=-1 for a whole z-stack per chunk')
+    parser.add_argument('--no-compression', action='store_true', help='write chunks uncompressed')
+    parser.add_argument('--threads', type=int, default=4, help='number of threads reading and writing chunks')
+    args = parser.parse_args()
+    chunks = {axis: int(size) for axis, size in (chunk.split('=') for chunk in args.chunks)}
+    dataset = Dataset(args.dataset_path)
+    export_zarr(dataset, args.store, chunks, None if args.no_compression else 'default', args.threads)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+"""
+Build the lower resolution levels (Downsampled_x2, Downsampled_x4, ...) of datasets that only have full resolution
+images. Run as python -m pycromanager.pyramid to build them from the command line
+"""
+import argparse
+import os
+import shutil
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from pycromanager.data import Dataset, _MultipageTiffReader
+from pycromanager.writer import _MultipageTiffWriter, _compressor
+
+
+def _downsample_2x(image):
+    """
+    Average each 2 x 2 block of pixels, dropping the last row or column if there's an odd number
+    """
+    height, width = image.shape[0] // 2 * 2, image.shape[1] // 2 * 2
+    blocks = image[:height, :width].reshape(height // 2, 2, width // 2, 2).astype(np.uint32)
+    return ((blocks.sum(axis=(1, 3)) + 2) // 4).astype(image.dtype)
+
+
+# names of the compressions NDTiffWriter can write, by TIFF compression tag value
+_COMPRESSION_NAMES = {_MultipageTiffReader.NO_COMPRESSION: None,
+                      _MultipageTiffReader.LZW_COMPRESSION: 'lzw',
+                      _MultipageTiffReader.DEFLATE_COMPRESSION: 'deflate',
+                      _MultipageTiffReader.OLD_DEFLATE_COMPRESSION: 'deflate',
+                      _MultipageTiffReader.ZSTD_COMPRESSION: 'zstd'}
+
+# readers opened by a worker process, by path, kept open across the batches of tiles it's given
+_worker_readers = {}
+
+
+def _downsample_tiles(source_path, keys, compression):
+    """
+    Read and downsample a batch of tiles of one file. Runs in a worker process
+
+    :param keys: (channel_index, z_index, t_index, pos_index) tuples of the tiles
+    :param compression: None, 'deflate', 'zstd' or 'lzw' to compress the downsampled tiles
+    :return: list of (downsampled tile, metadata, compressed pixels or None) tuples in the same order
+    """
+    reader = _worker_readers.get(source_path)
+    if reader is None:
+        reader = _worker_readers[source_path] = _MultipageTiffReader(source_path)
+    compress = _compressor(compression)[1]
+    tiles = []
+    for key in keys:
+        image, metadata = reader.read_image(*key, read_metadata=True, memmapped=True)
+        image = _downsample_2x(image)
+        tiles.append((image, metadata, compress(image.data) if compress is not None else None))
+    return tiles
+
+
+def _downsample_level(source_dir, dest_dir, num_processes, tiles_per_task):
+    """
+    Write a copy of every multipage tiff file in a directory with every tile downsampled 2x. Batches of tiles are
+    downsampled (and compressed, if the source is) by a pool of processes, so even a single large file is split across
+    all of them, and written by this process in the order they're stored. At most two batches per process are in
+    flight at a time, so memory use doesn't depend on the size of the files
+    """
+    max_in_flight = 2 * (num_processes if num_processes is not None else os.cpu_count() or 1)
+    # (writer, keys, future, whether it's the last batch of the file) of the batches submitted but not yet written
+    in_flight = deque()
+    open_writers = set()
+
+    def write_batch(writer, keys, future, is_last):
+        for key, (image, metadata, compressed) in zip(keys, future.result()):
+            writer.write_image(image, metadata, *key, compressed_pixels=compressed)
+        if is_last:
+            writer.close()
+            open_writers.discard(writer)
+
+    try:
+        with ProcessPoolExecutor(max_workers=num_processes) as executor:
+            for tiff in sorted(tiff for tiff in os.listdir(source_dir) if tiff.endswith('.tif')):
+                source_path = os.path.join(source_dir, tiff)
+                reader = _MultipageTiffReader(source_path)
+                try:
+                    if reader.compression not in _COMPRESSION_NAMES:
+                        raise Exception('Unsupported TIFF compression: {}'.format(reader.compression))
+                    compression = _COMPRESSION_NAMES[reader.compression]
+                    summary_md = dict(reader.summary_md, Width=reader.width // 2, Height=reader.height // 2)
+                    keys = [key for key, _ in sorted(reader.index.items(), key=lambda item: item[1][0])
+                            if reader.check_ifd(*key)]
+                    big_tiff = reader.big_tiff
+                finally:
+                    reader.close()
+                writer = _MultipageTiffWriter(os.path.join(dest_dir, tiff), summary_md, len(keys),
+                                              compression=compression, big_tiff=big_tiff)
+                open_writers.add(writer)
+                if not keys:
+                    writer.close()
+                    open_writers.discard(writer)
+                for start in range(0, len(keys), tiles_per_task):
+                    if len(in_flight) == max_in_flight:
+                        write_batch(*in_flight.popleft())
+                    batch = keys[start:start + tiles_per_task]
+                    in_flight.append((writer, batch, executor.submit(_downsample_tiles, source_path, batch,
+                                                                     compression),
+                                      start + tiles_per_task >= len(keys)))
+            while in_flight:
+                write_batch(*in_flight.popleft())
+    finally:
+        for writer in open_writers:
+            writer.close()
+
+
+def build_pyramid(dataset_path, max_downsample_factor=None, num_processes=None, tiles_per_task=16):
+    """
+    Build the lower resolution levels of a dataset by downsampling each tile of the level above it 2x, in the same
+    layout and with the same compression as the resolution levels that Dataset reads. Each level is built in a hidden
+    directory that is renamed once it's complete, and levels that already exist are kept, so an interrupted build can
+    be restarted. Batches of tiles are downsampled concurrently by a pool of processes, with a bounded number of
+    batches in memory at a time. On Windows, call this from within an if __name__ == '__main__' block
+
+    :param dataset_path: path to the top level of the dataset (i.e. the one that contains the Full resolution folder)
+    :param max_downsample_factor: lowest resolution level to build. By default, levels are built until the whole
+        dataset (stitched, if acquired in a grid) fits within a single full resolution tile
+    :type max_downsample_factor: int
+    :param num_processes: number of processes downsampling tiles. Defaults to the number of CPUs
+    :type num_processes: int
+    :param tiles_per_task: number of tiles each process downsamples at a time
+    :type tiles_per_task: int
+    :return: list of the downsample factors of the levels built
+    """
+    dataset = Dataset(dataset_path)
+    tile_shape = np.array([dataset.image_height, dataset.image_width])
+    if dataset._POSITION_AXIS in dataset.axes and hasattr(dataset, 'row_col_array'):
+        full_shape = np.array(dataset._stitched_shape())
+    else:
+        full_shape = tile_shape
+    dataset.close()
+    if max_downsample_factor is None:
+        max_downsample_factor = 2
+        while np.any(full_shape / max_downsample_factor > tile_shape):
+            max_downsample_factor *= 2
+
+    built = []
+    source_dir = os.path.join(dataset_path, 'Full resolution')
+    factor = 2
+    while factor <= max_downsample_factor and np.all(tile_shape // factor > 0):
+        res_dir = os.path.join(dataset_path, 'Downsampled_x{}'.format(factor))
+        if not os.path.isdir(res_dir):
+            # Dataset ignores directories not named like resolution levels, so a partial level is never opened
+            partial_dir = os.path.join(dataset_path, '.Downsampled_x{}.partial'.format(factor))
+            shutil.rmtree(partial_dir, ignore_errors=True)
+            os.mkdir(partial_dir)
+            _downsample_level(source_dir, partial_dir, num_processes, tiles_per_task)
+            os.rename(partial_dir, res_dir)
+            built.append(factor)
+        source_dir = res_dir
+        factor *= 2
+    return built
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the lower resolution levels of an NDTiff dataset')
+    parser.add_argument('dataset_path', help='top level of the dataset (i.e. the one that contains the Full resolution '
+                                             'folder)')
+    parser.add_argument('--max-downsample-factor', type=int, default=None,
+                        help='lowest resolution to build, e.g. 8 for Downsampled_x2, x4 and x8')
+    parser.add_argument('--processes', type=int, default=None, help='number of processes downsampling tiles')
+    parser.add_argument('--tiles-per-task', type=int, default=16,
+                        help='number of tiles each process downsamples at a time')
+    args = parser.parse_args()
+    built = build_pyramid(args.dataset_path, args.max_downsample_factor, args.processes, args.tiles_per_task)
+    print('Built resolution levels: {}'.format(', '.join('Downsampled_x{}'.format(factor) for factor in built)))
+
+
+if __name__ == '__main__':
+    main()
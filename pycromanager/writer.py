@@ -0,0 +1,406 @@
+"""
+Library for writing datasets in the NDTiff format read by pycromanager.data.Dataset
+"""
+import json
+import os
+import queue
+import struct
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from pycromanager.data import _MultipageTiffReader
+
+
+def _compressor(compression, level=None):
+    """
+    :param compression: None, 'deflate', 'zstd' or 'lzw'
+    :param level: compression level, or None for the default of the compression
+    :return: the value of the TIFF compression tag, and a function that compresses bytes (or None if uncompressed)
+    """
+    if compression is None:
+        return _MultipageTiffReader.NO_COMPRESSION, None
+    if compression == 'deflate':
+        return _MultipageTiffReader.DEFLATE_COMPRESSION, lambda data: zlib.compress(data, -1 if level is None else level)
+    if compression == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise Exception('Writing zstd compressed images requires the zstandard package')
+        return _MultipageTiffReader.ZSTD_COMPRESSION, \
+            lambda data: zstandard.ZstdCompressor(level=3 if level is None else level).compress(data)
+    if compression == 'lzw':
+        try:
+            import imagecodecs
+        except ImportError:
+            raise Exception('Writing LZW compressed images requires the imagecodecs package')
+        return _MultipageTiffReader.LZW_COMPRESSION, imagecodecs.lzw_encode
+    raise Exception('Unknown compression: {}'.format(compression))
+
+
+class _MultipageTiffWriter:
+    """
+    Writes a single multipage tiff file of a dataset: the TIFF header, summary metadata and an index map with room for a
+    fixed number of images, followed by the IFD, pixels and metadata of each image. Images go through a large write
+    buffer, and the index map is only updated on flush, after the images themselves have reached the file, so the file
+    can be read while it's still being written. Files larger than 4 GB need big_tiff=True. Call close() when finished
+    """
+    # every IFD has the same 13 entries, so that pixels always start at the same offset after the IFD
+    ENTRIES_PER_IFD = _MultipageTiffReader.ENTRIES_PER_IFD
+    IFD_SIZE = _MultipageTiffReader.layout(False)['ifd_size']
+    BIG_IFD_SIZE = _MultipageTiffReader.layout(True)['ifd_size']
+
+    def __init__(self, tiff_path, summary_md, max_images, buffer_size=8 * 1024 * 1024, compression=None,
+                 compression_level=None, big_tiff=False):
+        """
+        :param tiff_path: full path of the TIFF file to create
+        :param summary_md: summary metadata dict. Must contain Width, Height and PixelType (GRAY8 or GRAY16)
+        :param max_images: number of images the index map has room for
+        :param buffer_size: size in bytes of the write buffer
+        :param compression: None, or 'deflate', 'zstd' (requires zstandard) or 'lzw' (requires imagecodecs) to compress
+            the pixels of each image
+        :param compression_level: compression level, or None for the default of the compression
+        :param big_tiff: write the BigTIFF-style variant of the format, with 64 bit offsets
+        """
+        self.tiff_path = tiff_path
+        self.big_tiff = big_tiff
+        self.ifd_size = self.BIG_IFD_SIZE if big_tiff else self.IFD_SIZE
+        layout = _MultipageTiffReader.layout(big_tiff)
+        self._offset_format = '<Q' if big_tiff else '<I'
+        self._index_map_entry_size = layout['index_map_entry_dtype'].itemsize
+        self.compression_tag, self.compress = _compressor(compression, compression_level)
+        self.max_images = max_images
+        self.num_images = 0
+        self.width = summary_md['Width']
+        self.height = summary_md['Height']
+        self.dtype = np.uint8 if summary_md['PixelType'] == 'GRAY8' else np.uint16
+        pixel_size_um = summary_md.get('PixelSize_um', 0)
+        # pixels per cm as a rational, for TIFF readers that show physical units
+        self._resolution = struct.pack('<II', int(round(1e6 / pixel_size_um)), 100) if pixel_size_um else \
+            struct.pack('<II', 1, 1)
+        summary_md_bytes = json.dumps(summary_md).encode()
+        summary_md_start = layout['summary_md_header_offset']
+        # byte offset of the index map header, which is followed by the image count and then the entries
+        self._index_map_offset = summary_md_start + 8 + len(summary_md_bytes)
+        first_ifd_offset = self._index_map_offset + 8 + max_images * self._index_map_entry_size
+        first_ifd_offset += first_ifd_offset % 2
+        header = bytearray(first_ifd_offset)
+        if big_tiff:
+            header[:16] = b'\x49\x49' + struct.pack('<HHHQ', _MultipageTiffReader.BIG_TIFF_MAGIC, 8, 0, first_ifd_offset)
+            header[16:28] = struct.pack('<IQ', _MultipageTiffReader.INDEX_MAP_OFFSET_HEADER, self._index_map_offset)
+        else:
+            header[:8] = b'\x49\x49' + struct.pack('<HI', _MultipageTiffReader.TIFF_MAGIC, first_ifd_offset)
+            header[8:16] = struct.pack('<II', _MultipageTiffReader.INDEX_MAP_OFFSET_HEADER, self._index_map_offset)
+        header[summary_md_start:summary_md_start + 8] = struct.pack('<II', _MultipageTiffReader.SUMMARY_MD_HEADER,
+                                                                    len(summary_md_bytes))
+        header[summary_md_start + 8:self._index_map_offset] = summary_md_bytes
+        header[self._index_map_offset:self._index_map_offset + 8] = struct.pack(
+            '<II', _MultipageTiffReader.INDEX_MAP_HEADER, 0)
+        self.file = open(tiff_path, 'wb', buffering=buffer_size)
+        self.file.write(header)
+        self.file_size = first_ifd_offset
+        # byte offset of the next IFD offset field of the last IFD written
+        self._last_next_ifd_field = None
+        # index map entries of images written since the last flush
+        self._unflushed_entries = []
+
+    def image_bytes(self, metadata_length, pixel_bytes=None):
+        """
+        :param pixel_bytes: number of bytes of (compressed) pixels, by default the size of an uncompressed image
+        :return: number of bytes an image with metadata of the given length takes up in the file
+        """
+        if pixel_bytes is None:
+            pixel_bytes = self.width * self.height * np.dtype(self.dtype).itemsize
+        # BigTIFF IFD entries hold the resolutions themselves, rather than their offsets
+        size = self.ifd_size + pixel_bytes + (0 if self.big_tiff else 16) + metadata_length
+        return size + size % 2
+
+    def write_image(self, pixels, metadata, channel_index, z_index, t_index, pos_index, compressed_pixels=None):
+        """
+        :param pixels: 2D numpy array with the width, height and dtype given in the summary metadata
+        :param metadata: dict of image metadata, or the bytes of it already encoded as JSON
+        :param compressed_pixels: the pixels already compressed with self.compress, so that images can be compressed
+            elsewhere in parallel
+        """
+        if self.num_images == self.max_images:
+            raise Exception('No room left in the index map of {}'.format(self.tiff_path))
+        pixels = np.ascontiguousarray(pixels, dtype=self.dtype)
+        if pixels.shape != (self.height, self.width):
+            raise Exception('Image shape {} doesn\'t match the summary metadata'.format(pixels.shape))
+        if self.compress is None:
+            pixel_data = pixels.data
+            pixel_bytes = pixels.nbytes
+        else:
+            pixel_data = compressed_pixels if compressed_pixels is not None else self.compress(pixels.data)
+            pixel_bytes = len(pixel_data)
+        metadata_bytes = metadata if isinstance(metadata, bytes) else json.dumps(metadata).encode()
+        ifd_offset = self.file_size
+        pixel_offset = ifd_offset + self.ifd_size
+        resolution_offset = pixel_offset + pixel_bytes
+        metadata_offset = resolution_offset + (0 if self.big_tiff else 16)
+        next_ifd_offset = ifd_offset + self.image_bytes(len(metadata_bytes), pixel_bytes)
+        # offsets are LONG8 values in BigTIFF
+        offset_type = 16 if self.big_tiff else 4
+        entries = [(_MultipageTiffReader.WIDTH, 4, 1, self.width),
+                   (_MultipageTiffReader.HEIGHT, 4, 1, self.height),
+                   (_MultipageTiffReader.BITS_PER_SAMPLE, 3, 1, pixels.itemsize * 8),
+                   (_MultipageTiffReader.COMPRESSION, 3, 1, self.compression_tag),
+                   (_MultipageTiffReader.PHOTOMETRIC_INTERPRETATION, 3, 1, 1),
+                   (_MultipageTiffReader.STRIP_OFFSETS, offset_type, 1, pixel_offset),
+                   (_MultipageTiffReader.SAMPLES_PER_PIXEL, 3, 1, 1),
+                   (_MultipageTiffReader.ROWS_PER_STRIP, 3, 1, self.height),
+                   (_MultipageTiffReader.STRIP_BYTE_COUNTS, offset_type, 1, pixel_bytes),
+                   (_MultipageTiffReader.X_RESOLUTION, 5, 1, resolution_offset),
+                   (_MultipageTiffReader.Y_RESOLUTION, 5, 1, resolution_offset + 8),
+                   (_MultipageTiffReader.RESOLUTION_UNIT, 3, 1, 3),
+                   (_MultipageTiffReader.MM_METADATA, 2, len(metadata_bytes), metadata_offset)]
+        if self.big_tiff:
+            ifd = bytearray(struct.pack('<Q', self.ENTRIES_PER_IFD))
+            for tag, entry_type, count, value in entries:
+                # values of up to 8 bytes, including a single RATIONAL, are stored in the entry itself
+                if entry_type == 5:
+                    value_bytes = self._resolution
+                elif entry_type == 3:
+                    value_bytes = struct.pack('<H6x', value)
+                else:
+                    value_bytes = struct.pack('<Q', value)
+                ifd += struct.pack('<HHQ', tag, entry_type, count) + value_bytes
+        else:
+            ifd = bytearray(struct.pack('<H', self.ENTRIES_PER_IFD))
+            for tag, entry_type, count, value in entries:
+                # a single SHORT is stored in the first two bytes of the value field
+                ifd += struct.pack('<HHIHH' if entry_type == 3 else '<HHII', tag, entry_type, count, value,
+                                   *([0] if entry_type == 3 else []))
+        # point to where the next image will go. The last image is set to point nowhere on close
+        ifd += struct.pack(self._offset_format, next_ifd_offset)
+        self.file.write(ifd)
+        self.file.write(pixel_data)
+        if not self.big_tiff:
+            self.file.write(self._resolution * 2)
+        self.file.write(metadata_bytes)
+        if (metadata_offset + len(metadata_bytes)) % 2:
+            self.file.write(b'\x00')
+        self._last_next_ifd_field = ifd_offset + self.ifd_size - struct.calcsize(self._offset_format)
+        self.file_size = next_ifd_offset
+        self.num_images += 1
+        self._unflushed_entries.append(struct.pack('<iiii' + self._offset_format[1:], channel_index, z_index, t_index,
+                                                   pos_index, ifd_offset))
+
+    def flush(self):
+        """
+        Write out buffered images and add them to the index map
+        """
+        if not self._unflushed_entries:
+            return
+        self.file.flush()
+        # add the images to the index map, and only then count them, so that readers never see an incomplete image
+        num_flushed = self.num_images - len(self._unflushed_entries)
+        self.file.seek(self._index_map_offset + 8 + num_flushed * self._index_map_entry_size)
+        self.file.write(b''.join(self._unflushed_entries))
+        self.file.flush()
+        self.file.seek(self._index_map_offset + 4)
+        self.file.write(struct.pack('<I', self.num_images))
+        self.file.flush()
+        self.file.seek(self.file_size)
+        self._unflushed_entries = []
+
+    def close(self):
+        self.flush()
+        if self._last_next_ifd_field is not None:
+            self.file.seek(self._last_next_ifd_field)
+            self.file.write(struct.pack(self._offset_format, 0))
+        self.file.close()
+
+
+class NDTiffWriter:
+    """
+    Write images to a new dataset that Dataset can read, e.g. from an image processor that diverts images from the
+    default storage. Images are written in the order they arrive by a background thread, into the Full resolution
+    directory of the dataset, starting a new file whenever the current one is full. Use as a context manager or call
+    close() when finished. With compression, images are compressed by a pool of threads and still written in order
+    """
+
+    def __init__(self, dataset_path, summary_metadata=None, name=None, max_file_size=2 ** 32 - 1,
+                 max_images_per_file=65536, flush_bytes=64 * 1024 * 1024, max_queued_bytes=512 * 1024 * 1024,
+                 compression=None, compression_level=None, num_compression_threads=4, big_tiff=False):
+        """
+        :param dataset_path: directory to create the dataset in
+        :param summary_metadata: summary metadata dict. Width, Height and PixelType are filled in from the first image
+            if they're missing, and PixelSize_um defaults to 0
+        :param name: prefix of the TIFF file names. Defaults to the name of the dataset directory
+        :param max_file_size: size in bytes at which to start a new file. Can't exceed 4 GB, the largest size TIFF
+            offsets can address, unless big_tiff is True
+        :param max_images_per_file: number of images at which to start a new file, which sets the size of the index map
+            at the start of each file
+        :param flush_bytes: number of bytes written between flushes, after which the images are visible to readers
+            (such as a Dataset opened with live=True). Images are also flushed whenever the writer catches up
+        :param max_queued_bytes: size in bytes of images waiting to be written above which write_image blocks until the
+            background thread catches up
+        :param compression: None, or 'deflate', 'zstd' (requires zstandard) or 'lzw' (requires imagecodecs) to compress
+            each image. Compressed images can't be read with memmapped=True
+        :param compression_level: compression level, or None for the default of the compression
+        :param num_compression_threads: number of threads compressing images
+        :param big_tiff: write files in the BigTIFF-style variant of the format, with 64 bit offsets, so that a larger
+            max_file_size can be used and fast acquisitions aren't split into many small files
+        """
+        if max_file_size > 2 ** 32 - 1 and not big_tiff:
+            raise Exception('Files can be at most 4 GB unless big_tiff=True')
+        self.path = dataset_path
+        self.summary_metadata = dict(summary_metadata) if summary_metadata is not None else {}
+        self.name = name if name is not None else os.path.basename(os.path.normpath(dataset_path))
+        self.max_file_size = max_file_size
+        self.max_images_per_file = max_images_per_file
+        self.flush_bytes = flush_bytes
+        self.max_queued_bytes = max_queued_bytes
+        self.compression = compression
+        self.compression_level = compression_level
+        self.big_tiff = big_tiff
+        # fail here rather than on the first image if the compression isn't available
+        self._compress = _compressor(compression, compression_level)[1]
+        self._num_compression_threads = num_compression_threads
+        self._compression_executor = None
+        self._res_dir = os.path.join(dataset_path, 'Full resolution')
+        os.makedirs(self._res_dir, exist_ok=True)
+        # map from frozen sets of the non-zpt axes of each storage channel to its index
+        self._storage_channels = {}
+        self._file_writers = []
+        self._queue = None
+        self._thread = None
+        self._error = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def write_image(self, image, metadata):
+        """
+        Queue an image to be written. The image must not be modified after it's been passed in
+
+        :param image: 2D numpy array of dtype uint8 or uint16
+        :param metadata: dict of image metadata. Must contain 'Axes', a dict mapping axis names (e.g. 'channel', 'z',
+            'time', 'position') to the image's index along each axis. Axes missing a 'channel' get channel 0, and
+            metadata missing a 'Channel' name gets one from its channel index. It's encoded as JSON before this returns
+        """
+        self._raise_error()
+        if self._queue is None:
+            self._start(image)
+        if image.shape != (self.summary_metadata['Height'], self.summary_metadata['Width']) or \
+                image.dtype != self._dtype:
+            raise Exception('Image of shape {} and type {} doesn\'t match the dataset'.format(image.shape,
+                                                                                                image.dtype))
+        metadata = dict(metadata)
+        axes = dict(metadata['Axes'])
+        axes.setdefault('channel', 0)
+        metadata['Axes'] = axes
+        metadata.setdefault('Channel', str(axes['channel']))
+        non_zpt_axes = frozenset((axis, value) for axis, value in axes.items() if axis not in ('z', 'time', 'position'))
+        channel_index = self._storage_channels.setdefault(non_zpt_axes, len(self._storage_channels))
+        # encoded once, on the calling thread, since large metadata is one of the slowest parts of writing an image
+        metadata = json.dumps(metadata).encode()
+        compressed = None
+        if self._compression_executor is not None:
+            compressed = self._compression_executor.submit(self._compress, np.ascontiguousarray(image).data)
+        self._queue.put((image, metadata, channel_index, axes.get('z', 0), axes.get('time', 0),
+                         axes.get('position', 0), compressed))
+
+    def _start(self, image):
+        """
+        Fill in the summary metadata from the first image and start the background thread
+        """
+        if image.dtype == np.uint8:
+            pixel_type = 'GRAY8'
+        elif image.dtype == np.uint16:
+            pixel_type = 'GRAY16'
+        else:
+            raise Exception('Unsupported image type: {}'.format(image.dtype))
+        self.summary_metadata.setdefault('Width', image.shape[1])
+        self.summary_metadata.setdefault('Height', image.shape[0])
+        self.summary_metadata.setdefault('PixelType', pixel_type)
+        # unknown, but required by Dataset
+        self.summary_metadata.setdefault('PixelSize_um', 0)
+        self._dtype = np.uint8 if self.summary_metadata['PixelType'] == 'GRAY8' else np.uint16
+        self._queue = queue.Queue(maxsize=max(1, self.max_queued_bytes // max(1, image.nbytes)))
+        if self._compress is not None:
+            self._compression_executor = ThreadPoolExecutor(max_workers=self._num_compression_threads,
+                                                            thread_name_prefix='NDTiff compression')
+        self._thread = threading.Thread(target=self._write_loop, name='NDTiff writer', daemon=True)
+        self._thread.start()
+
+    def _write_loop(self):
+        bytes_since_flush = 0
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    try:
+                        if self._file_writers:
+                            self._file_writers[-1].close()
+                    except Exception as e:
+                        if self._error is None:
+                            self._error = e
+                    # the sentinel always ends the loop, even if closing the last file failed, so close() can't hang
+                    return
+                if self._error is not None:
+                    # drop images after a failure so that write_image doesn't block forever
+                    continue
+                image, metadata, channel_index, z_index, t_index, pos_index, compressed = item
+                if compressed is not None:
+                    compressed = compressed.result()
+                self._write(image, metadata, channel_index, z_index, t_index, pos_index, compressed)
+                bytes_since_flush += image.nbytes
+                if bytes_since_flush >= self.flush_bytes or self._queue.empty():
+                    self._file_writers[-1].flush()
+                    bytes_since_flush = 0
+            except Exception as e:
+                self._error = e
+            finally:
+                self._queue.task_done()
+
+    def _write(self, image, metadata, channel_index, z_index, t_index, pos_index, compressed=None):
+        """
+        :param metadata: bytes of the image metadata encoded as JSON
+        """
+        pixel_bytes = len(compressed) if compressed is not None else None
+        writer = self._file_writers[-1] if self._file_writers else None
+        if writer is None or writer.num_images == writer.max_images or \
+                writer.file_size + writer.image_bytes(len(metadata), pixel_bytes) > self.max_file_size:
+            if writer is not None:
+                writer.close()
+            suffix = '' if not self._file_writers else '_{}'.format(len(self._file_writers))
+            tiff_path = os.path.join(self._res_dir, '{}_NDTiffStack{}.tif'.format(self.name, suffix))
+            # no more images than can fit in the file, so that large images don't get a needlessly large index map.
+            # How many compressed images fit isn't known ahead of time, so those get a full size index map
+            max_images = self.max_images_per_file
+            if compressed is None:
+                ifd_size = _MultipageTiffWriter.BIG_IFD_SIZE if self.big_tiff else _MultipageTiffWriter.IFD_SIZE
+                max_images = min(max_images, self.max_file_size // (ifd_size + image.nbytes))
+            writer = _MultipageTiffWriter(tiff_path, self.summary_metadata, max(1, max_images),
+                                          compression=self.compression, compression_level=self.compression_level,
+                                          big_tiff=self.big_tiff)
+            self._file_writers.append(writer)
+        writer.write_image(image, metadata, channel_index, z_index, t_index, pos_index, compressed)
+
+    def _raise_error(self):
+        if self._error is not None:
+            raise Exception('Writing dataset {} failed: {}'.format(self.path, self._error))
+
+    def flush(self):
+        """
+        Block until every image passed to write_image has been written and is visible to readers
+        """
+        if self._queue is not None:
+            self._queue.join()
+        self._raise_error()
+
+    def close(self):
+        """
+        Write any remaining images and close the dataset
+        """
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        if self._compression_executor is not None:
+            self._compression_executor.shutdown()
+        self._raise_error()
@@ -0,0 +1,157 @@
+"""
+This example benchmarks reading datasets with pycromanager.Dataset, on a synthetic dataset or an existing one. Results
+are saved as JSON, and passing the results of an earlier run with --compare prints how much each benchmark changed, e.g.
+to compare two commits:
+
+    python benchmark_data.py --output before.json
+    (check out the other commit)
+    python benchmark_data.py --output after.json --compare before.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import numpy as np
+from pycromanager import Dataset
+from synthetic_dataset import make_synthetic_dataset
+
+
+def time_calls(fn, args_list):
+    """
+    :return: dict with the median, 95th percentile and total time of calling fn with each set of args, in seconds
+    """
+    times = []
+    for args in args_list:
+        start = time.perf_counter()
+        fn(*args)
+        times.append(time.perf_counter() - start)
+    return {'median_s': float(np.median(times)), 'p95_s': float(np.percentile(times, 95)),
+            'total_s': float(np.sum(times)), 'calls': len(times)}
+
+
+def open_quietly(path, **kwargs):
+    # Dataset prints progress while opening
+    with contextlib.redirect_stdout(io.StringIO()):
+        return Dataset(path, **kwargs)
+
+
+def run_benchmarks(path, num_samples, seed=0):
+    rng = np.random.default_rng(seed)
+    results = {}
+    results['open'] = time_calls(lambda: open_quietly(path).close(), [()] * 5)
+    dataset = open_quietly(path)
+    keys = list(dataset.res_levels[1].reader_index)
+    storage_channel_axes = {c: dict(axes) for axes, c in dataset._extra_axes_to_storage_channel.items()}
+    samples = []
+    for i in rng.integers(0, len(keys), num_samples):
+        c, z, t, p = keys[i]
+        axes = dict(storage_channel_axes[c], z=z, time=t, position=p)
+        samples.append(({axis: value for axis, value in axes.items() if axis in dataset.axes},))
+    results['read_image'] = time_calls(lambda axes: dataset.read_image(**axes), samples)
+    results['read_image_memmapped'] = time_calls(lambda axes: dataset.read_image(**axes, memmapped=True), samples)
+    results['read_metadata'] = time_calls(lambda axes: dataset.read_metadata(**axes), samples)
+    results['has_image'] = time_calls(lambda axes: dataset.has_image(**axes), samples)
+    with contextlib.redirect_stdout(io.StringIO()):
+        results['as_array_build'] = time_calls(lambda: dataset.as_array(), [()] * 3)
+    results['as_array_block_reader_build'] = time_calls(lambda: dataset.as_array(block_reader=True), [()] * 3)
+    results['iter_images_storage_order'] = time_calls(lambda: sum(1 for _ in dataset.iter_images()), [()])
+
+    if 'position' in dataset.axes and hasattr(dataset, 'row_col_array'):
+        stitched = dataset.as_array(stitched=True, block_reader=True)
+        stitched_shape = stitched.shape[-2:]
+        size = [min(512, n) for n in stitched_shape]
+        windows = [(int(rng.integers(0, stitched_shape[0] - size[0] + 1)),
+                    int(rng.integers(0, stitched_shape[1] - size[1] + 1))) for _ in range(num_samples // 10 + 1)]
+        results['read_region'] = time_calls(lambda y, x: dataset.read_region(y, x, size[0], size[1]), windows)
+        index = (0,) * (stitched.ndim - 2)
+        results['stitched_block_reader_compute'] = time_calls(
+            lambda y, x: stitched[index + (slice(y, y + size[0]), slice(x, x + size[1]))].compute(), windows)
+    dataset.close()
+    return results
+
+
+def run_compression_benchmarks(path, compressions=('deflate', 'zstd'), thread_counts=(1, 4), num_images=200):
+    """
+    Compare reading an uncompressed synthetic dataset through memory maps against decompressing the same images
+    compressed with each compression, decoded by different numbers of threads
+
+    :return: dict of benchmark results, each with the throughput in MB/s of uncompressed pixels read
+    """
+    results = {}
+    synthetic_config = dict(channels=2, z_slices=10, time_points=1, grid_rows=2, grid_cols=5, overlap=0,
+                            image_height=512, image_width=512)
+    for compression in (None,) + tuple(compressions):
+        data_path = os.path.join(path, compression or 'uncompressed')
+        try:
+            make_synthetic_dataset(data_path, compression=compression, **synthetic_config)
+        except Exception as e:
+            # zstd and lzw need optional packages
+            print('Skipping {}: {}'.format(compression, e))
+            continue
+        for num_threads in thread_counts if compression is not None else (1,):
+            dataset = open_quietly(data_path, num_decode_threads=num_threads)
+            indices = [{'channel': c, 'z': z, 'position': p} for p in range(10) for z in range(10)
+                       for c in range(2)][:num_images]
+            result = time_calls(lambda: dataset.read_images(indices), [()] * 5)
+            nbytes = len(indices) * synthetic_config['image_height'] * synthetic_config['image_width'] * 2
+            result['MB_per_s'] = nbytes / result['median_s'] / 1e6
+            results['read_images_{}_{}_threads'.format(compression or 'uncompressed', num_threads)] = result
+            dataset.close()
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark reading datasets with pycromanager.Dataset')
+    parser.add_argument('--data', default=None, help='existing dataset to benchmark. By default a synthetic one is '
+                                                     'generated in a temporary directory')
+    parser.add_argument('--samples', type=int, default=1000, help='number of random images read per benchmark')
+    parser.add_argument('--output', default=None, help='JSON file to save results to')
+    parser.add_argument('--compare', default=None, help='JSON results of an earlier run to compare against')
+    parser.add_argument('--compression', action='store_true', help='also compare reading uncompressed and compressed '
+                                                                   'synthetic datasets')
+    args = parser.parse_args()
+
+    config = {'data': args.data, 'samples': args.samples}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        data_path = args.data
+        if data_path is None:
+            data_path = os.path.join(temp_dir, 'synthetic')
+            synthetic_config = dict(channels=2, z_slices=10, time_points=5, grid_rows=3, grid_cols=3, overlap=32,
+                                    image_height=512, image_width=512, max_file_size=256 * 1024 * 1024)
+            config['synthetic'] = synthetic_config
+            make_synthetic_dataset(data_path, **synthetic_config)
+        results = run_benchmarks(data_path, args.samples)
+        if args.compression:
+            results.update(run_compression_benchmarks(os.path.join(temp_dir, 'compression')))
+
+    output = {'commit': git_commit(), 'python': platform.python_version(), 'numpy': np.__version__,
+              'config': config, 'results': results}
+    previous = None
+    if args.compare is not None:
+        with open(args.compare) as f:
+            previous = json.load(f)
+    print('{:<40}{:>14}{:>14}{:>10}'.format('benchmark', 'median (ms)', 'before (ms)', 'change'))
+    for name, result in results.items():
+        line = '{:<40}{:>14.4f}'.format(name, result['median_s'] * 1000)
+        if previous is not None and name in previous['results']:
+            before = previous['results'][name]['median_s']
+            line += '{:>14.4f}{:>9.2f}x'.format(before * 1000, result['median_s'] / before if before else np.nan)
+        if 'MB_per_s' in result:
+            line += '  {:.0f} MB/s'.format(result['MB_per_s'])
+        print(line)
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(output, f, indent=2)
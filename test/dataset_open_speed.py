@@ -0,0 +1,28 @@
+"""
+This example measures how much faster a dataset opens when its TIFF files are opened and parsed by a pool of threads
+rather than one at a time
+"""
+import time
+from pycromanager import Dataset
+
+#This path is to the top level of the dataset (i.e. the one that contains the Full resolution folder)
+data_path = '/path/to/data'
+#number of threads to compare against opening files serially
+num_threads = 8
+#open all resolution levels, since that's where the most files are
+full_res_only = False
+
+def time_open(num_open_threads):
+    start = time.time()
+    dataset = Dataset(data_path, full_res_only=full_res_only, num_open_threads=num_open_threads)
+    elapsed = time.time() - start
+    dataset.close()
+    return elapsed
+
+#the first open warms the OS file cache so the two timings below are comparable
+time_open(1)
+serial_time = time_open(1)
+parallel_time = time_open(num_threads)
+print('Serial open: {:.3f} s'.format(serial_time))
+print('Open with {} threads: {:.3f} s'.format(num_threads, parallel_time))
+print('Speedup: {:.2f}x'.format(serial_time / parallel_time))
@@ -0,0 +1,74 @@
+"""
+This example generates a synthetic dataset in the same format as those acquired by Micro-Manager, for testing and
+benchmarking pycromanager.Dataset without a microscope. Run it as a script or call make_synthetic_dataset
+"""
+import argparse
+import numpy as np
+from pycromanager import NDTiffWriter
+from pycromanager.pyramid import build_pyramid
+
+
+def make_synthetic_dataset(path, channels=2, z_slices=5, time_points=3, grid_rows=2, grid_cols=2, overlap=16,
+                           image_height=256, image_width=256, dtype=np.uint16, max_file_size=2 ** 32 - 1,
+                           pyramid_levels=0, seed=0, compression=None,
+                           big_tiff=False):
+    """
+    Write a dataset with the given number of channels, z slices, time points and XY positions laid out in a grid
+
+    :param path: directory to create the dataset in
+    :param overlap: number of pixels adjacent tiles of the grid overlap by
+    :param max_file_size: size in bytes at which to start a new file
+    :param pyramid_levels: number of downsampled resolution levels to build (Downsampled_x2, x4, ...)
+    :param seed: seed of the random noise in the images
+    :param compression: None, 'deflate', 'zstd' or 'lzw' to compress the full resolution images
+    :param big_tiff: write files with 64 bit offsets, which allows a max_file_size above 4 GB
+    :return: dict mapping (channel, z, time, position) to the value added to the noise pattern in that image, which
+        makes every image different
+    """
+    rng = np.random.default_rng(seed)
+    max_value = 255 if dtype == np.uint8 else 4095
+    # one noise pattern shared by every image with a different offset, so that generating images is fast
+    noise = rng.integers(0, max_value // 2, (image_height, image_width)).astype(dtype)
+    channel_names = ['Channel{}'.format(c) for c in range(channels)]
+    summary_metadata = {'PixelSize_um': 0.5, 'z-step_um': 1.0, 'ChNames': channel_names}
+    if grid_rows * grid_cols > 1:
+        summary_metadata.update({'GridPixelOverlapX': overlap, 'GridPixelOverlapY': overlap})
+    offsets = {}
+    with NDTiffWriter(path, summary_metadata, max_file_size=max_file_size, compression=compression,
+                      big_tiff=big_tiff) as writer:
+        for t in range(time_points):
+            for p in range(grid_rows * grid_cols):
+                for z in range(z_slices):
+                    for c in range(channels):
+                        offset = (c * 101 + z * 13 + t * 7 + p * 3) % (max_value // 2)
+                        offsets[(c, z, t, p)] = offset
+                        metadata = {'Axes': {'channel': c, 'z': z, 'time': t, 'position': p},
+                                    'Channel': channel_names[c], 'GridRowIndex': p // grid_cols,
+                                    'GridColumnIndex': p % grid_cols, 'ElapsedTime-ms': t * 1000.0 + z * 10.0 + c,
+                                    'ZPosition_um': z * summary_metadata['z-step_um']}
+                        writer.write_image(noise + dtype(offset), metadata)
+    if pyramid_levels > 0:
+        build_pyramid(path, max_downsample_factor=2 ** pyramid_levels)
+    return offsets
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate a synthetic NDTiff dataset')
+    parser.add_argument('path', help='directory to create the dataset in')
+    parser.add_argument('--channels', type=int, default=2)
+    parser.add_argument('--z-slices', type=int, default=5)
+    parser.add_argument('--time-points', type=int, default=3)
+    parser.add_argument('--grid-rows', type=int, default=2)
+    parser.add_argument('--grid-cols', type=int, default=2)
+    parser.add_argument('--overlap', type=int, default=16)
+    parser.add_argument('--image-size', type=int, nargs=2, default=[256, 256], metavar=('HEIGHT', 'WIDTH'))
+    parser.add_argument('--bit-depth', type=int, choices=[8, 16], default=16)
+    parser.add_argument('--max-file-size', type=int, default=2 ** 32 - 1, help='bytes at which to start a new file')
+    parser.add_argument('--pyramid-levels', type=int, default=0)
+    parser.add_argument('--compression', choices=['deflate', 'zstd', 'lzw'], default=None)
+    parser.add_argument('--big-tiff', action='store_true', help='write files with 64 bit offsets')
+    args = parser.parse_args()
+    make_synthetic_dataset(args.path, args.channels, args.z_slices, args.time_points, args.grid_rows, args.grid_cols,
+                           args.overlap, args.image_size[0], args.image_size[1],
+                           np.uint8 if args.bit_depth == 8 else np.uint16, args.max_file_size, args.pyramid_levels,
+                           compression=args.compression, big_tiff=args.big_tiff)
@@ -0,0 +1,111 @@
+"""
+Tests of reading datasets with pycromanager.Dataset, on synthetic datasets written by NDTiffWriter. Run with pytest from
+this directory
+"""
+import glob
+import os
+import pickle
+import numpy as np
+import pytest
+from pycromanager import Dataset, NDTiffWriter
+from pycromanager.data import _MultipageTiffReader
+from synthetic_dataset import make_synthetic_dataset
+
+
+def overwrite_ifd_count(path, key, count, file_index=0):
+    """
+    Overwrite the entry count of the IFD of one image, as a torn write might
+
+    :param key: (channel_index, z_index, t_index, pos_index) of the image
+    :param file_index: index of the file containing the image, in order of file name
+    """
+    tiff_path = sorted(glob.glob(os.path.join(path, 'Full resolution', '*.tif')))[file_index]
+    reader = _MultipageTiffReader(tiff_path)
+    ifd_offset = reader.index[key][0]
+    reader.close()
+    with open(tiff_path, 'r+b') as f:
+        f.seek(ifd_offset)
+        f.write(np.uint16(count).tobytes())
+
+
+def test_ifd_with_huge_entry_count_is_invalid(tmp_path):
+    # large enough that the entries a count of 65535 claims lie within the file
+    path = str(tmp_path / 'dataset')
+    make_synthetic_dataset(path, channels=2, z_slices=25, time_points=20, grid_rows=1, grid_cols=1, image_height=32,
+                           image_width=32)
+    overwrite_ifd_count(path, (1, 2, 0, 0), 65535)
+    dataset = Dataset(path)
+    assert not dataset.has_image(channel=1, z=2, time=0)
+    assert dataset.has_image(channel=0, z=2, time=0)
+    reader = dataset.res_levels[1].reader_list[0]
+    assert np.count_nonzero(reader.valid_images()) == len(reader.index) - 1
+    dataset.close()
+
+
+def test_ifd_with_no_entries_is_invalid(tmp_path):
+    path = str(tmp_path / 'dataset')
+    make_synthetic_dataset(path, image_height=16, image_width=16)
+    overwrite_ifd_count(path, (0, 1, 0, 0), 0)
+    dataset = Dataset(path)
+    assert not dataset.has_image(channel=0, z=1, time=0, position=0)
+    reader = dataset.res_levels[1].reader_list[0]
+    # a chunk of IFDs that all have no entries
+    assert not reader._read_ifds([reader.index[0, 1, 0, 0][0]])['valid'][0]
+    with pytest.raises(Exception, match='Missing tags'):
+        dataset.res_levels[1].read_metadata_batch([(0, 1, 0, 0)])
+    dataset.close()
+
+
+@pytest.mark.parametrize('compression', [None, 'deflate'])
+def test_corrupted_first_ifd_only_affects_its_image(tmp_path, compression):
+    path = str(tmp_path / 'dataset')
+    offsets = make_synthetic_dataset(path, time_points=2, image_height=16, image_width=16, compression=compression,
+                                     max_file_size=64 * 1024)
+    second_file = sorted(glob.glob(os.path.join(path, 'Full resolution', '*.tif')))[1]
+    reader = _MultipageTiffReader(second_file)
+    first_key = min(reader.index, key=lambda key: reader.index[key][0])
+    keys = list(reader.index)
+    reader.close()
+    overwrite_ifd_count(path, first_key, 0, file_index=1)
+    dataset = Dataset(path)
+    noise = dataset.read_image(channel=0, z=0, time=0, position=0).astype(np.int64) - offsets[(0, 0, 0, 0)]
+    for c, z, t, p in keys:
+        if (c, z, t, p) != first_key:
+            assert np.array_equal(dataset.read_image(channel=c, z=z, time=t, position=p), noise + offsets[c, z, t, p])
+    assert len(list(dataset.iter_images())) == len(offsets) - 1
+    dataset.close()
+
+
+def test_max_open_files(tmp_path):
+    path = str(tmp_path / 'dataset')
+    offsets = make_synthetic_dataset(path, image_height=16, image_width=16, max_file_size=16 * 1024)
+    with pytest.raises(Exception, match='max_open_files'):
+        Dataset(path, max_open_files=0)
+    dataset = Dataset(path, max_open_files=1)
+    assert len(dataset.res_levels[1].reader_list) > 1
+    noise = dataset.read_image(channel=0, z=0, time=0, position=0).astype(np.int64) - offsets[(0, 0, 0, 0)]
+    for (c, z, t, p), offset in offsets.items():
+        assert np.array_equal(dataset.read_image(channel=c, z=z, time=t, position=p), noise + offset)
+    dataset.close()
+
+
+def test_block_reader_arrays_dont_share_dask_keys(tmp_path):
+    path = str(tmp_path / 'dataset')
+    writer = NDTiffWriter(path)
+    writer.write_image(np.zeros((8, 8), dtype=np.uint16), {'Axes': {'z': 0}})
+    writer.flush()
+    dataset, other = Dataset(path, live=True), Dataset(path)
+    name = dataset.as_array(block_reader=True).name
+    assert name == dataset.as_array(block_reader=True).name
+    assert name == pickle.loads(pickle.dumps(dataset)).as_array(block_reader=True).name
+    assert name != other.as_array(block_reader=True).name
+    # the same image written again
+    writer.write_image(np.ones((8, 8), dtype=np.uint16), {'Axes': {'z': 0}})
+    writer.flush()
+    dataset.refresh()
+    array = dataset.as_array(block_reader=True)
+    assert array.name != name
+    assert np.all(array.compute() == 1)
+    writer.close()
+    dataset.close()
+    other.close()
@@ -0,0 +1,87 @@
+"""
+Tests of _LazyMetadata, which looks up top level keys of image metadata without decoding all of it, against json.loads
+on randomly generated JSON. Run with pytest from this directory
+"""
+import json
+import random
+import pytest
+from pycromanager import Dataset
+from pycromanager.data import _LazyMetadata
+from synthetic_dataset import make_synthetic_dataset
+
+# characters that trip up a scanner: brackets, quotes, colons, commas and backslashes inside strings
+ALPHABET = 'ab{}[]":,\\ \t\nxé/<1'
+KEYS = ['Axes', 'Channel', 'a', 'b', 'GridRowIndex', 'x{', 'k"', 'é', 'a\\', ':', ',', 'null', '1', ' ', '","', '[1]',
+        '] [', '{', 'true']
+
+
+def random_string(rng):
+    return ''.join(rng.choice(ALPHABET) for _ in range(rng.randint(0, 6)))
+
+
+def random_value(rng, depth):
+    r = rng.random()
+    if depth < 3 and r < 0.2:
+        return {rng.choice(KEYS + [random_string(rng)]): random_value(rng, depth + 1) for _ in range(rng.randint(0, 4))}
+    if depth < 3 and r < 0.35:
+        return [random_value(rng, depth + 1) for _ in range(rng.randint(0, 3))]
+    return rng.choice([random_string(rng), rng.randint(-5, 5), 1.5, None, True, rng.choice(KEYS)])
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_lookups_match_json_loads(monkeypatch, seed):
+    # index even small metadata, which would otherwise just be decoded in full
+    monkeypatch.setattr(_LazyMetadata, 'MIN_LAZY_LENGTH', 0)
+    rng = random.Random(seed)
+    for _ in range(1000):
+        obj = {rng.choice(KEYS + [random_string(rng)]): random_value(rng, 1) for _ in range(rng.randint(0, 8))}
+        for indent, separators, ensure_ascii in [(None, None, True), (None, (',', ':'), False), (1, None, False)]:
+            raw = json.dumps(obj, indent=indent, separators=separators, ensure_ascii=ensure_ascii).encode()
+            shared = _LazyMetadata(raw)
+            for key in KEYS + list(obj):
+                # a fresh mapping for each key, and one shared by all of them, so lookups use both a new index and one
+                # that earlier lookups built
+                for metadata in (_LazyMetadata(raw), shared):
+                    if key in obj:
+                        assert metadata[key] == obj[key], (raw, key)
+                    else:
+                        with pytest.raises(KeyError):
+                            metadata[key]
+
+
+def test_large_metadata():
+    # with few enough brackets and braces to be worth indexing
+    obj = {'Core-Prop{}'.format(i): 'value {} with "quotes", [brackets] and {{braces}}'.format(i) if i % 10 == 0 else
+           'value {}'.format(i) for i in range(500)}
+    obj.update({'Axes': {'channel': 1, 'z': 2}, 'Nested': {'Axes': 'not top level'}, 'ElapsedTime-ms': 12.5})
+    raw = json.dumps(obj).encode()
+    assert len(raw) > _LazyMetadata.MIN_LAZY_LENGTH
+    metadata = _LazyMetadata(raw)
+    assert metadata['Axes'] == {'channel': 1, 'z': 2}
+    assert metadata['ElapsedTime-ms'] == 12.5
+    assert metadata.get('Missing') is None
+    assert metadata._decoded is None
+    assert dict(metadata) == obj
+
+
+def test_mapping_interface():
+    metadata = _LazyMetadata(b'{"a": 1, "b": {"a": 2}, "a": 3}')
+    # the last of duplicate keys wins, as with json.loads
+    assert metadata['a'] == 3
+    assert 'b' in metadata and 'c' not in metadata
+    assert len(metadata) == 2 and sorted(metadata) == ['a', 'b']
+    assert metadata == {'a': 3, 'b': {'a': 2}}
+
+
+@pytest.mark.parametrize('tile_cache_bytes', [0, 10 ** 7])
+def test_read_lazily_from_dataset(tmp_path, tile_cache_bytes):
+    path = str(tmp_path / 'dataset')
+    make_synthetic_dataset(path, image_height=16, image_width=16)
+    dataset = Dataset(path, tile_cache_bytes=tile_cache_bytes)
+    axes = dict(channel=1, z=2, time=1, position=3)
+    full = dataset.read_metadata(**axes)
+    metadata = dataset.read_metadata(**axes, lazy=True)
+    assert isinstance(metadata, _LazyMetadata) and metadata['Axes'] == axes and dict(metadata) == full
+    _, metadata = dataset.read_image(**axes, read_metadata=True, lazy=True)
+    assert isinstance(metadata, _LazyMetadata) and metadata['Axes'] == axes and dict(metadata) == full
+    dataset.close()
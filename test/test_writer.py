@@ -0,0 +1,66 @@
+"""
+Round trip tests of NDTiffWriter: datasets written by it are read back with pycromanager.Dataset. Run with pytest from
+this directory
+"""
+import numpy as np
+import pytest
+from pycromanager import Dataset, NDTiffWriter
+from pycromanager.writer import _MultipageTiffWriter
+from synthetic_dataset import make_synthetic_dataset
+
+
+def check_round_trip(path, **kwargs):
+    config = dict(channels=2, z_slices=3, time_points=2, grid_rows=2, grid_cols=2, image_height=64, image_width=48)
+    config.update(kwargs)
+    offsets = make_synthetic_dataset(path, **config)
+    dataset = Dataset(path)
+    try:
+        assert sorted(dataset.axes['channel']) == list(range(config['channels']))
+        assert sorted(dataset.axes['z']) == list(range(config['z_slices']))
+        assert sorted(dataset.axes['time']) == list(range(config['time_points']))
+        assert sorted(dataset.axes['position']) == list(range(config['grid_rows'] * config['grid_cols']))
+        # every image is the same noise pattern plus a different offset
+        noise = dataset.read_image(channel=0, z=0, time=0, position=0).astype(np.int64) - offsets[(0, 0, 0, 0)]
+        for (c, z, t, p), offset in offsets.items():
+            image, metadata = dataset.read_image(channel=c, z=z, time=t, position=p, read_metadata=True)
+            assert image.shape == (config['image_height'], config['image_width'])
+            assert np.array_equal(image, noise + offset)
+            assert metadata['Axes'] == {'channel': c, 'z': z, 'time': t, 'position': p}
+            assert metadata['GridRowIndex'] == p // config['grid_cols']
+            assert metadata['GridColumnIndex'] == p % config['grid_cols']
+        assert dataset.summary_metadata['PixelSize_um'] == 0.5
+        # axes of as_array are in the order of Dataset.axes, which all have values starting at 0
+        array = dataset.as_array()
+        for (c, z, t, p), offset in offsets.items():
+            index = tuple({'channel': c, 'z': z, 'time': t, 'position': p}[axis] for axis in dataset.axes)
+            assert np.array_equal(array[index].compute(), noise + offset)
+    finally:
+        dataset.close()
+
+
+def test_round_trip(tmp_path):
+    check_round_trip(str(tmp_path / 'dataset'))
+
+
+def test_round_trip_uint8_many_files(tmp_path):
+    check_round_trip(str(tmp_path / 'dataset'), dtype=np.uint8, max_file_size=64 * 1024)
+
+
+def test_round_trip_compressed(tmp_path):
+    check_round_trip(str(tmp_path / 'dataset'), compression='deflate')
+
+
+def test_round_trip_big_tiff(tmp_path):
+    check_round_trip(str(tmp_path / 'dataset'), big_tiff=True, max_file_size=64 * 1024)
+
+
+def test_close_raises_when_closing_the_last_file_fails(tmp_path, monkeypatch):
+    def fail(self):
+        raise OSError('No space left on device')
+
+    writer = NDTiffWriter(str(tmp_path / 'dataset'))
+    writer.write_image(np.zeros((8, 8), dtype=np.uint16), {'Axes': {'z': 0}})
+    writer.flush()
+    monkeypatch.setattr(_MultipageTiffWriter, 'close', fail)
+    with pytest.raises(Exception, match='No space left on device'):
+        writer.close()